@@ -38,12 +38,11 @@ if(os.path.isfile(checkpoint_paths[0]) and os.path.isfile(checkpoint_paths[1])):
     fasta_file = "fasta_tests/fasta_files/fruit_fly.fasta"
     reference_proteins = read_fasta(fasta_file, max_size=1000, protein_len_range=(100, 150))
 
-    i = 0
-    for key, protein in reference_proteins.items():
-        environment.set_seq(target_dna, protein)
+    results = agent.test_batch([(target_dna, protein) for protein in reference_proteins.values()])
 
-        score, reward = agent.test("", "", "", save=False)
-        aligner_score, _, __ = aligner.align(target_dna, protein, debug=False)
+    i = 0
+    for protein, (score, reward) in zip(reference_proteins.values(), results):
+        aligner_score = aligner.align_score(target_dna, protein)
         percent_diff = (abs(aligner_score - score) / ((score + aligner_score)/2)) * 100
 
         with open(f"{save_dir}/results.txt", 'a') as file:
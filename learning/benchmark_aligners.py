@@ -28,7 +28,7 @@ def gen_seqs(bp_len, mutated=True):
 
 
 def seq_zhang(dna, protein, result: Path):
-    aligner = ThreeFrameAligner()
+    aligner = ThreeFrameAligner(profile_memory=True)
     start = time.time()
     score, actions, align = aligner.align(dna, protein, debug=False)
     end = time.time()
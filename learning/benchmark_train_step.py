@@ -0,0 +1,88 @@
+from models_v2.environment import Environment
+from models_v2.main_agent import Agent
+from models_v2.network import DDDQN
+from params import PARAMS
+import tensorflow as tf
+import numpy as np
+import time
+import os
+
+
+def make_agent(**overrides):
+    params = {**PARAMS, **overrides}
+    main_qn = DDDQN(params['lr'], len(params['actions']), params['input_shape'])
+    target_qn = DDDQN(params['lr'], len(params['actions']), params['input_shape'])
+    return Agent(main_qn, target_qn, Environment(window_size=params['window_size']), params, params['actions'])
+
+
+def fill_buffer(agent):
+    dna_dir, protein_dir = "data/dna", "data/proteins"
+    dna_list = [open(f"{dna_dir}/{fn}").read().strip() for fn in os.listdir(dna_dir)]
+    protein_list = [open(f"{protein_dir}/{fn}").read().strip() for fn in os.listdir(protein_dir)]
+    agent.explore_pairs(list(zip(dna_list, protein_list)))
+
+
+def old_train_step(agent, batch):
+    """
+    Training step as it ran before train_step, target Q-values computed eagerly around update_mainQN
+    """
+    states, actions, rewards, next_states, dones = batch
+    weights = np.ones(len(actions), dtype=np.float32)
+
+    next_q_val_target = agent.targetQN.model(next_states)
+    best_actions = tf.argmax(next_q_val_target, axis=1, output_type=tf.int32)
+    action_results = tf.gather(next_q_val_target, best_actions, axis=1, batch_dims=1)
+    target_q_values = rewards + (agent.gamma * action_results * (1-dones))
+
+    indices = tf.range(len(actions), dtype=tf.int32)
+    action_indices = tf.stack([indices, actions], axis = 1)
+
+    _, td_errors = agent.update_mainQN(states, target_q_values, action_indices, weights)
+    return td_errors.numpy()
+
+
+def old_soft_update(agent, tau):
+    for target_weight, local_weight in zip(agent.targetQN.model.weights, agent.mainQN.model.weights):
+        target_weight.assign(tau * local_weight + (1 - tau) * target_weight)
+
+
+def time_per_call(fn, batches, warmup=10):
+    for batch in batches[:warmup]:
+        fn(batch)
+
+    start = time.perf_counter()
+    for batch in batches[warmup:]:
+        fn(batch)
+    return (time.perf_counter() - start) / (len(batches) - warmup) * 1000
+
+
+if __name__ == '__main__':
+    steps = 100
+    tau = PARAMS['tau']
+    results = []
+
+    for jit_compile in (False, True):
+        agent = make_agent(jit_compile=jit_compile, train_tau=tau)
+        fill_buffer(agent)
+        batches = [agent.episodeBuffer.sample(agent.batchSize) for _ in range(steps)]
+
+        if not jit_compile:
+            results.append(("eager target + update_mainQN", time_per_call(lambda batch: old_train_step(agent, batch), batches)))
+            results.append(("  + per-variable soft update", time_per_call(lambda batch: (old_train_step(agent, batch), old_soft_update(agent, tau)), batches)))
+
+        label = "XLA" if jit_compile else "tf.function"
+        agent.train_tau = 0.0
+        results.append((f"train_on_batch ({label})", time_per_call(agent.train_on_batch, batches)))
+        agent.train_tau = tau
+        results.append((f"  + fused Polyak update ({label})", time_per_call(agent.train_on_batch, batches)))
+
+    # Batches sampled in the graph, timed per gradient step
+    updates = 4
+    agent = make_agent(graph_replay=True, updates_per_train=updates)
+    fill_buffer(agent)
+    calls = [None] * (steps // updates)
+    results.append((f"graph replay, {updates} updates per train", time_per_call(lambda _: agent.train(), calls, warmup=2) / updates))
+
+    print(f"\nPer-step latency, batch size {PARAMS['batch_size']}, {steps - 10} steps")
+    for name, ms in results:
+        print(f"{name:40s} {ms:8.3f} ms")
@@ -66,11 +66,8 @@ if __name__ == '__main__':
                 save_file.write(header + "\n")
 
                 # Compare to all other proteins
-                for ref_id, ref_prot in reference_proteins.items():
-                    # Set Protein and DNA
-                    environment.set_seq(target_dna, ref_prot)
-                    score, reward = agent.test("", "", "", save=False)
-                    
+                results = agent.test_batch([(target_dna, ref_prot) for ref_prot in reference_proteins.values()])
+                for ref_id, (score, reward) in zip(reference_proteins, results):
                     output = "{:<10} {:<10} {:<30}".format(score, reward, ref_id)
                     print(output)
 
@@ -0,0 +1,66 @@
+import os
+import time
+import numpy as np
+import tensorflow as tf
+tf.get_logger().setLevel('ERROR')
+
+from models_v2.environment import Environment
+from models_v2.main_agent import Agent
+from models_v2.network import DDDQN
+from models_v2.student import distill
+from params import PARAMS
+
+# Directory Paths
+checkpoint_path = "./saved_weights/main/main_checkpoint.weights.h5"
+student_path = "./saved_weights/main/student.npz"
+dna_dir = "data/dna"
+protein_dir = "data/proteins"
+
+
+def time_per_batch(get_actions, states, repeats):
+    get_actions(states)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        get_actions(states)
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+if __name__ == '__main__':
+    if(os.path.isfile(checkpoint_path)):
+        # Load Parameters
+        input_shape = PARAMS['input_shape']
+        actions = PARAMS['actions']
+        learning_rate = PARAMS['lr']
+
+        MainQN = DDDQN(learning_rate, len(actions), input_shape)
+        TargetQN = DDDQN(learning_rate, len(actions), input_shape)
+        environment = Environment(window_size=PARAMS['window_size'])
+        agent = Agent(MainQN, TargetQN, environment, PARAMS, actions)
+        MainQN.model.load_weights(checkpoint_path)
+
+        # Matching DNA and Protein files
+        pairs = []
+        for fn in sorted(os.listdir(dna_dir)):
+            protein_fn = fn.replace("DNA", "AA", 1)
+            if os.path.isfile(f"{protein_dir}/{protein_fn}"):
+                with open(f"{dna_dir}/{fn}", 'r') as dna_file, open(f"{protein_dir}/{protein_fn}", 'r') as protein_file:
+                    pairs.append((dna_file.read().strip(), protein_file.read().strip()))
+
+        start = time.time()
+        student, agreement = distill(agent, pairs, hidden=PARAMS['student_hidden'], epochs=PARAMS['student_epochs'],
+                                     threshold=PARAMS['student_agreement'], quantize=PARAMS['student_quantize'])
+        student.save(student_path)
+        print(f"Saved student to {student_path}, Agreement: {agreement}, Time Taken: {time.time() - start}")
+
+        # Test actions of the main network and of the student on the same states
+        environment.set_seq(*pairs[0])
+        states = np.stack([environment.get_state() for _ in range(PARAMS['batch_size'])])
+        for batch in (1, PARAMS['batch_size']):
+            teacher_ms = time_per_batch(lambda s: agent.get_actions(s, test=True), states[:batch], 20)
+            agent.student = student
+            student_ms = time_per_batch(lambda s: agent.get_actions(s, test=True), states[:batch], 200)
+            agent.student = None
+            print(f"Batch {batch}: Main Network {teacher_ms:.3f} ms, Student {student_ms:.3f} ms, {teacher_ms / student_ms:.0f}x")
+
+    else:
+        print(f"No weights found at {checkpoint_path}")
@@ -0,0 +1,27 @@
+import os
+import tensorflow as tf
+tf.get_logger().setLevel('ERROR')
+
+from models_v2.network import DDDQN
+from params import PARAMS
+
+# Directory Paths
+checkpoint_path = "./saved_weights/main/main_checkpoint.weights.h5"
+export_path = "./saved_weights/main/main_checkpoint.npz"
+
+if __name__ == '__main__':
+    if(os.path.isfile(checkpoint_path)):
+        # Load Parameters
+        input_shape = PARAMS['input_shape']
+        actions = PARAMS['actions']
+        learning_rate = PARAMS['lr']
+
+        # Load Main QN and export its weights for models_v2.numpy_network.NumpyDDDQN
+        MainQN = DDDQN(learning_rate, len(actions), input_shape)
+        MainQN.model.load_weights(checkpoint_path)
+        MainQN.export_npz(export_path)
+
+        print(f"Exported {checkpoint_path} to {export_path}")
+
+    else:
+        print(f"No weights found at {checkpoint_path}")
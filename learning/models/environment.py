@@ -2,6 +2,7 @@ import os
 import blosum as bl
 from datetime import datetime
 from utils.encoder import get_codon_encoding, get_protein_encoding, get_table
+from utils.scoring import build_score_table, codon_index, residue_index
 from utils.constants import GAP_EXTENSION_PENALTY, GAP_OPEN_PENALTY, FRAMESHIFT_PENALTY, Action
 from params import PARAMS
 from utils.aligner import ThreeFrameAligner
@@ -24,6 +25,7 @@ class Environment:
         self.table = get_table()
         self.encoded_proteins = get_protein_encoding()
         self.encoded_codons = get_codon_encoding(self.encoded_proteins, self.table)
+        self.score_table = build_score_table(self.rewards, self.table, default=0)
 
         # Initial Pointers
         self.dna_pointer = 0
@@ -567,7 +569,7 @@ class Environment:
         if codon == "*":
             return 0
 
-        return self.rewards[self.table[codon]][protein]
+        return int(self.score_table[codon_index(codon), residue_index(protein)])
 
     def print_frames(self, action):
         """
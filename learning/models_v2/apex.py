@@ -0,0 +1,221 @@
+import multiprocessing as mp
+import queue
+import random
+import time
+import numpy as np
+from models_v2.experience_buffer import encode_states
+from models_v2.numpy_network import NumpyDDDQN
+from models_v2.vec_environment import VecEnvironment
+
+
+def actor_epsilons(num_actors: int, base: float = 0.4, alpha: float = 7.0):
+    """
+    Exploration rate of every actor, spread from base down to base ** (1 + alpha) as in Ape-X
+
+    Args:
+        num_actors (int): Number of actors
+        base (float, optional): Epsilon of the first actor. Defaults to 0.4.
+        alpha (float, optional): Spread of the epsilons. Defaults to 7.0.
+    """
+    if num_actors == 1:
+        return [base]
+
+    return [base ** (1 + alpha * i / (num_actors - 1)) for i in range(num_actors)]
+
+
+def run_actor(actor_id, pairs, epsilon, params, transitions, weights, stop, seed):
+    """
+    Actor process, plays epsilon-greedy episodes with a NumPy copy of the main network and streams
+    the encoded transitions to the learner. Runs without TensorFlow.
+
+    Args:
+        actor_id (int): Index of the actor
+        pairs (list[tuple[str, str]]): DNA and Protein Sequences to play
+        epsilon (float): Exploration rate of the actor
+        params (dict): User defined parameters
+        transitions (Queue): Batches sent to the learner
+        weights (Queue): Newest weights of the main network, see DDDQN.numpy_weights
+        stop (Event): Set by the learner to end the actor
+        seed (int): Random seed of the actor
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+
+    # Batches still queued when the learner stops are dropped instead of blocking the exit of the actor
+    transitions.cancel_join_thread()
+
+    vec_env = VecEnvironment(pairs, params.get('actor_envs', 8), window_size=params['window_size'])
+    actions_space = params['actions']
+    send_every = params.get('actor_send_steps', 32)
+
+    q_network = None
+    started = np.full(len(vec_env), time.time())
+    batch = []
+    finished = []
+    states = vec_env.get_states()
+
+    while not stop.is_set():
+        # Pick up the newest broadcast weights, the first ones are waited for
+        try:
+            q_network = NumpyDDDQN(weights.get(timeout=1.0) if q_network is None else weights.get_nowait())
+        except queue.Empty:
+            if q_network is None:
+                continue
+
+        # Same policy as Agent.get_actions
+        actions = np.argmax(q_network.model(states), axis=1)
+        explore = np.random.uniform(0, 1, size=len(actions)) < epsilon
+        actions[explore] = np.random.choice(actions_space, size=np.count_nonzero(explore))
+
+        _, rewards, dones, next_states = vec_env.step(actions)
+        batch.append((encode_states(states), actions, rewards, encode_states(next_states), dones))
+
+        now = time.time()
+        for (score, reward, steps), k in zip(vec_env.pop_finished(), np.flatnonzero(dones)):
+            finished.append((actor_id, epsilon, score, reward, steps, now - started[k]))
+            started[k] = now
+
+        states = vec_env.get_states()
+
+        if len(batch) >= send_every:
+            message = tuple(np.concatenate(column) for column in zip(*batch)) + (finished,)
+            batch, finished = [], []
+
+            # The learner may be gone, never block past a stop
+            while not stop.is_set():
+                try:
+                    transitions.put(message, timeout=1.0)
+                    break
+                except queue.Full:
+                    pass
+
+
+class ApeXTrainer():
+
+    def __init__(self, agent, pairs: list, params: dict):
+        """
+        Initialize an Ape-X style actor-learner trainer. Actor processes play the pairs with copies of the main
+        network and their own exploration rates, the agent learns from their transitions in this process.
+
+        Args:
+            agent (Agent): Learner, owns the main and target networks and the replay buffer
+            pairs (list[tuple[str, str]]): DNA and Protein Sequences to train on
+            params (dict): User defined parameters
+        """
+        self.agent = agent
+        self.pairs = pairs
+        self.params = params
+        self.num_actors = params['num_actors']
+        self.sync_freq = params.get('weight_sync_freq', 50)
+        self.epsilons = actor_epsilons(self.num_actors)
+
+        # Actors run NumPy only, forking them leaves the TensorFlow state of the learner alone
+        self.context = mp.get_context('fork')
+        self.transitions = self.context.Queue(maxsize=4 * self.num_actors)
+        self.weights = [self.context.Queue(maxsize=1) for _ in range(self.num_actors)]
+        self.stop_event = self.context.Event()
+        self.actors = []
+
+        self.updates = 0
+
+    def broadcast(self):
+        """
+        Sends the current weights of the main network to every actor, replacing weights not picked up yet
+        """
+        weights = self.agent.mainQN.numpy_weights()
+
+        for weight_queue in self.weights:
+            try:
+                weight_queue.get_nowait()
+            except queue.Empty:
+                pass
+            weight_queue.put(weights)
+
+    def start(self):
+        """
+        Starts the actor processes
+        """
+        self.broadcast()
+        self.stop_event.clear()
+
+        for actor_id, epsilon in enumerate(self.epsilons):
+            actor = self.context.Process(
+                target=run_actor,
+                args=(actor_id, self.pairs, epsilon, self.params, self.transitions, self.weights[actor_id],
+                      self.stop_event, random.randrange(1 << 31)),
+                daemon=True,
+            )
+            actor.start()
+            self.actors.append(actor)
+
+    def stop(self):
+        """
+        Stops the actor processes
+        """
+        self.stop_event.set()
+
+        for actor in self.actors:
+            actor.join(timeout=5.0)
+            if actor.is_alive():
+                actor.terminate()
+
+        self.actors = []
+
+        # Unread weights would otherwise keep this process from exiting
+        for weight_queue in self.weights:
+            weight_queue.cancel_join_thread()
+
+    def drain(self, block: bool):
+        """
+        Moves the batches sent by the actors into the replay buffer
+
+        Args:
+            block (bool): Wait for a batch if none is ready
+
+        Returns:
+            Finished Episodes: (actor, epsilon, score, reward, steps, duration) of every episode in the batches
+        """
+        finished = []
+
+        while True:
+            try:
+                states, actions, rewards, next_states, dones, episodes = self.transitions.get(block=block, timeout=1.0)
+            except queue.Empty:
+                return finished
+
+            if self.agent.episodeBuffer.states is None:
+                self.agent.episodeBuffer.allocate(self.params['input_shape'])
+
+            self.agent.episodeBuffer.add_encoded(states, actions, rewards, next_states, dones)
+            finished.extend(episodes)
+            block = False
+
+    def run(self, max_episodes: int):
+        """
+        Trains the agent until the actors have finished max_episodes episodes
+
+        Yields:
+            Finished Episodes: (actor, epsilon, score, reward, steps, duration) of every episode as it arrives
+        """
+        episodes = 0
+        self.start()
+
+        try:
+            while episodes < max_episodes:
+                # Only wait on the actors until the replay buffer can fill a batch
+                ready = len(self.agent.episodeBuffer) >= self.agent.batchSize
+                finished = self.drain(block=not ready)
+
+                if ready:
+                    self.agent.train()
+                    self.updates += 1
+
+                    if self.updates % self.sync_freq == 0:
+                        self.broadcast()
+
+                for episode in finished[:max_episodes - episodes]:
+                    episodes += 1
+                    yield episode
+
+        finally:
+            self.stop()
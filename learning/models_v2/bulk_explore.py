@@ -0,0 +1,168 @@
+import numpy as np
+from utils.constants import GAP_EXTENSION_PENALTY, GAP_OPEN_PENALTY, FRAMESHIFT_PENALTY
+from utils.scoring import residue_index
+
+GAP_PENALTY = GAP_OPEN_PENALTY + GAP_EXTENSION_PENALTY
+STOP_RESIDUE = residue_index('*')
+
+
+def _lex_greater(x, y):
+    """
+    Whether every row of 3 scores in x comes after the row of y in list order, the comparison Python's max uses on lists
+    """
+    return (x[:, 0] > y[:, 0]) | ((x[:, 0] == y[:, 0]) & ((x[:, 1] > y[:, 1]) | ((x[:, 1] == y[:, 1]) & (x[:, 2] > y[:, 2]))))
+
+
+def transitions(score_table, codons, translated, protein_residues, d, p, actions):
+    """
+    (score, reward, dna_move, protein_move) of one action in many episodes, see Environment.get_transition
+
+    Args:
+        score_table: Codon by residue score table of the Environment
+        codons, translated: Codon index and translated residue index of every DNA position
+        protein_residues: Residue index of every protein position
+        d, p: DNA and protein pointers of every episode, into the arrays above
+        actions: Action of every episode
+
+    Returns:
+        NDArray: (episodes, 4) int64 outcomes
+    """
+    prev_protein, curr_protein = protein_residues[p - 1], protein_residues[p]
+    prev_stop, curr_stop = prev_protein == STOP_RESIDUE, curr_protein == STOP_RESIDUE
+
+    # Codons at d - 4 ... d + 1, the past frames followed by the current frames
+    window = d[:, np.newaxis] + np.arange(-4, 2)
+    past_frames, curr_frames = translated[window[:, :3]], translated[window[:, 3:]]
+
+    curr_scores = score_table[codons[window], curr_protein[:, np.newaxis]].astype(np.int64)
+    frame_scores = curr_scores[:, 3:]
+    shift_scores = frame_scores - [FRAMESHIFT_PENALTY, 0, FRAMESHIFT_PENALTY]
+    insertion_scores = score_table[codons[window[:, 3:]], prev_protein[:, np.newaxis]] - GAP_PENALTY
+    deletion_scores = curr_scores[:, :3] - GAP_PENALTY
+
+    matches = curr_frames == curr_protein[:, np.newaxis]
+    in_curr_frames = matches.any(axis=1)
+    in_past_frames = (past_frames == curr_protein[:, np.newaxis]).any(axis=1)
+    prev_in_curr_frames = (curr_frames == prev_protein[:, np.newaxis]).any(axis=1)
+
+    max_insertion = insertion_scores.max(axis=1)
+    max_deletion = deletion_scores.max(axis=1)
+    max_shift = shift_scores.max(axis=1)
+    cond = max_insertion <= max_deletion
+    gap_score = np.where(cond & in_past_frames, max_insertion, max_deletion)
+
+    # Largest of the three score lists in list order, as max(scores, scores_1, scores_2)
+    best = shift_scores
+    best = np.where(_lex_greater(insertion_scores, best)[:, np.newaxis], insertion_scores, best)
+    best = np.where(_lex_greater(deletion_scores, best)[:, np.newaxis], deletion_scores, best)
+
+    outcomes = np.zeros((len(d), 4), dtype=np.int64)
+
+    # MATCH, FRAMESHIFT 1 and FRAMESHIFT 3, a gap protein scores nothing and gets -2
+    frame_actions = [
+        (0, frame_scores[:, 1], matches[:, 1], 3),
+        (1, shift_scores[:, 0], ~matches[:, 1] & matches[:, 0], 2),
+        (2, shift_scores[:, 2], ~matches[:, 1] & ~matches[:, 0] & matches[:, 2], 4),
+    ]
+    for action, score, valid, dna_move in frame_actions:
+        rows = actions == action
+        outcomes[rows, 0] = np.where(curr_stop, 0, score)[rows]
+        outcomes[rows, 1] = np.where(curr_stop | ~valid, -2, 0)[rows]
+        outcomes[rows, 2] = dna_move
+        outcomes[rows, 3] = 1
+
+    # INSERTION and DELETION, gaps next to a gap protein or a matching frame score nothing, get -2 and skip ahead
+    gap_actions = [
+        (3, prev_stop | in_curr_frames, ~cond & prev_in_curr_frames, 2 + deletion_scores.argmax(axis=1), 0),
+        (4, curr_stop | in_curr_frames, cond & in_past_frames, 0, 1),
+    ]
+    for action, skip, valid, dna_move, protein_move in gap_actions:
+        rows = actions == action
+        outcomes[rows, 0] = np.where(skip, 0, gap_score)[rows]
+        outcomes[rows, 1] = np.where(skip | ~valid, -2, 1)[rows]
+        outcomes[rows, 2] = np.where(skip, 4, dna_move)[rows]
+        outcomes[rows, 3] = np.where(skip, 0, protein_move)[rows]
+
+    # MISMATCH
+    mismatch_valid = (
+        (max_shift > max_insertion) & (max_shift > max_deletion)
+    ) | (
+        ~prev_in_curr_frames & ~prev_stop & ~in_past_frames & ~in_curr_frames & ~curr_stop
+    )
+    rows = actions == 5
+    outcomes[rows, 0] = best.max(axis=1)[rows]
+    outcomes[rows, 1] = np.where(mismatch_valid, 0, -2)[rows]
+    outcomes[rows, 2] = (2 + shift_scores.argmax(axis=1))[rows]
+    outcomes[rows, 3] = 1
+
+    return outcomes
+
+
+def random_episodes(env, pairs: list, actions: list):
+    """
+    Plays one random-action episode of every pair at once, vectorized over the pairs and without building
+    one-hot states. Every step plays out as Environment.step with the same action would.
+
+    Args:
+        env (Environment): Environment whose tables are used, its sequences are replaced
+        pairs (list[tuple[str, str]]): DNA and Protein Sequences
+        actions (list): Actions drawn from uniformly, as in Agent.explore
+
+    Yields:
+        (states, actions, rewards, next_states, dones) of the episodes still running after every step,
+        with states encoded as by experience_buffer.encode_states
+    """
+    window_size = env.window_size
+
+    # State codes of every codon and residue, see experience_buffer.encode_states
+    codon_codes = (env.codon_encoding.argmax(axis=1) + 1).astype(np.uint8)
+    residue_codes = (env.residue_encoding.argmax(axis=1) + 1).astype(np.uint8)
+
+    # Padded sequences of all pairs back to back, pointers are offsets into them
+    dna_parts, protein_parts, dna_lens, protein_lens = [], [], [], []
+    for dna, protein in pairs:
+        env.set_seq(dna, protein)
+        tables = env.get_rollout_tables()
+        dna_parts.append(tables["dna_codons"])
+        protein_parts.append(tables["protein_residues"])
+        dna_lens.append(env.dna_len)
+        protein_lens.append(env.protein_len)
+
+    dna_starts = np.cumsum([0] + [len(part) for part in dna_parts[:-1]])
+    protein_starts = np.cumsum([0] + [len(part) for part in protein_parts[:-1]])
+    codons = np.concatenate(dna_parts)
+    translated = env.codon_residues[codons]
+    protein_residues = np.concatenate(protein_parts)
+
+    dna_codes = codon_codes[codons]
+    protein_codes = residue_codes[protein_residues]
+    dna_rows = np.concatenate([np.arange(-4, -1), np.arange(-1, window_size * 3 - 1)])
+    protein_rows = np.arange(-1, window_size)
+
+    def encode(d, p):
+        # Rows in the order of Environment.get_state
+        codon_rows = dna_codes[d[:, np.newaxis] + dna_rows]
+        residue_rows = protein_codes[p[:, np.newaxis] + protein_rows]
+        return np.concatenate([codon_rows[:, :3], residue_rows[:, :1], codon_rows[:, 3:], residue_rows[:, 1:]], axis=1)
+
+    # Every episode takes at least one step, as in Agent.explore
+    d = dna_starts + 4
+    p = protein_starts + 1
+    dna_ends = dna_starts + np.array(dna_lens)
+    protein_ends = protein_starts + np.array(protein_lens)
+
+    while len(d) > 0:
+        chosen = np.random.choice(actions, size=len(d))
+        states = encode(d, p)
+
+        outcomes = transitions(env.score_table, codons, translated, protein_residues, d, p, chosen)
+        d = d + outcomes[:, 2]
+        p = p + outcomes[:, 3]
+
+        dones = (d >= dna_ends) | (p >= protein_ends)
+        next_states = np.zeros_like(states)
+        next_states[~dones] = encode(d[~dones], p[~dones])
+
+        yield states, chosen, outcomes[:, 1], next_states, dones
+
+        d, p, dna_ends, protein_ends = d[~dones], p[~dones], dna_ends[~dones], protein_ends[~dones]
@@ -0,0 +1,221 @@
+import json
+import os
+import queue
+import threading
+from datetime import datetime
+import numpy as np
+
+MANIFEST = "manifest.json"
+
+
+def _atomic_write(path, write):
+    """
+    Writes a file through write(file) to a temporary file next to path, then renames it over path
+    """
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as file:
+        write(file)
+        file.flush()
+        os.fsync(file.fileno())
+
+    os.replace(temp_path, path)
+
+
+class CheckpointManager():
+
+    def __init__(self, directory: str, keep: int = 3, export=None, replay: bool = False):
+        """
+        Initialize a manager that snapshots the training state in memory and writes it on a background thread.
+        Every checkpoint is written to a temporary file and renamed into place, a manifest lists the kept ones.
+
+        Args:
+            directory (str): Directory of the checkpoints and manifest
+            keep (int, optional): Number of newest checkpoints kept. Defaults to 3.
+            export (optional): Called on the writer thread with every snapshot after it is written,
+                               e.g. to export the weights in another format. Defaults to None.
+            replay (bool, optional): Also persist the replay buffer of the agent, as a .npy file that is
+                                     memory-mapped on restore. Defaults to False.
+        """
+        self.directory = directory
+        self.keep = keep
+        self.export = export
+        self.replay = replay
+        os.makedirs(directory, exist_ok=True)
+
+        self.manifest = self.load_manifest()
+        self.error = None
+
+        # Bounded so at most two snapshots wait in memory
+        self.snapshots = queue.Queue(maxsize=2)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def load_manifest(self):
+        """
+        Reads the manifest of the directory
+
+        Returns:
+            dict: {"checkpoints": [...], "latest": file or None}, oldest checkpoint first
+        """
+        path = os.path.join(self.directory, MANIFEST)
+        if not os.path.isfile(path):
+            return {"checkpoints": [], "latest": None}
+
+        with open(path, "r") as file:
+            return json.load(file)
+
+    def latest(self):
+        """
+        Returns the manifest entry of the newest checkpoint, None if there is none
+        """
+        return self.manifest["checkpoints"][-1] if self.manifest["checkpoints"] else None
+
+    def save(self, agent, episode: int, **extra):
+        """
+        Snapshots the networks, optimizer state and epsilon of the agent and queues them to be written.
+        Returns once the snapshot is taken, waits only while two earlier snapshots are still being written.
+
+        Args:
+            agent (Agent): Agent to snapshot
+            episode (int): Episode counter stored with the checkpoint
+            extra: JSON serializable values stored in the manifest entry
+        """
+        self.raise_error()
+
+        # Weights are copied, training goes on while they are written
+        agent.sync_learner()
+        snapshot = {
+            "episode": int(episode),
+            "epsilon": float(agent.epsilon),
+            "main": agent.mainQN.model.get_weights(),
+            "target": agent.targetQN.model.get_weights(),
+            "optimizer": [np.array(variable) for variable in agent.optimizer.variables],
+            "extra": extra,
+        }
+
+        if self.replay:
+            snapshot["replay"] = agent.episodeBuffer.snapshot()
+
+        self.snapshots.put(snapshot)
+
+    def run(self):
+        while True:
+            snapshot = self.snapshots.get()
+            try:
+                if snapshot is None:
+                    return
+
+                if self.error is None:
+                    self.write(snapshot)
+
+            except Exception as error:
+                self.error = error
+
+            finally:
+                self.snapshots.task_done()
+
+    def write(self, snapshot):
+        """
+        Writes a snapshot, adds it to the manifest and removes checkpoints beyond keep
+        """
+        filename = f"checkpoint-{snapshot['episode']:08d}.npz"
+        arrays = {}
+        for name in ("main", "target", "optimizer"):
+            for k, array in enumerate(snapshot[name]):
+                arrays[f"{name}_{k}"] = array
+
+        _atomic_write(os.path.join(self.directory, filename), lambda file: np.savez(file, **arrays))
+
+        entry = {
+            "file": filename,
+            "episode": snapshot["episode"],
+            "epsilon": snapshot["epsilon"],
+            "saved_at": datetime.now().isoformat(),
+            **snapshot["extra"],
+        }
+
+        records, replay_meta = snapshot.get("replay", (None, None))
+        if records is not None:
+            entry["replay"] = f"replay-{snapshot['episode']:08d}.npy"
+            entry["replay_meta"] = replay_meta
+            _atomic_write(os.path.join(self.directory, entry["replay"]), lambda file: np.save(file, records))
+
+        checkpoints = [checkpoint for checkpoint in self.manifest["checkpoints"] if checkpoint["file"] != filename]
+        checkpoints.append(entry)
+        removed, checkpoints = checkpoints[:-self.keep], checkpoints[-self.keep:]
+
+        manifest = {"checkpoints": checkpoints, "latest": filename}
+        _atomic_write(os.path.join(self.directory, MANIFEST), lambda file: file.write(json.dumps(manifest, indent=2).encode()))
+        self.manifest = manifest
+
+        # Old files go only once the manifest no longer lists them
+        for checkpoint in removed:
+            for file in (checkpoint["file"], checkpoint.get("replay")):
+                path = os.path.join(self.directory, file) if file else None
+                if path and os.path.isfile(path):
+                    os.remove(path)
+
+        if self.export is not None:
+            self.export(snapshot)
+
+    def restore(self, agent, entry: dict = None, replay: bool = True):
+        """
+        Loads a checkpoint into the agent, the newest one by default
+
+        Args:
+            agent (Agent): Agent to restore
+            entry (dict, optional): Manifest entry of the checkpoint. Defaults to None.
+            replay (bool, optional): Also restore the replay buffer if the checkpoint has one. Defaults to True.
+
+        Returns:
+            dict: Manifest entry of the restored checkpoint, None if there is no checkpoint
+        """
+        entry = entry or self.latest()
+        if entry is None:
+            return None
+
+        agent.sync_learner()
+
+        with np.load(os.path.join(self.directory, entry["file"])) as arrays:
+            def load(name):
+                return [arrays[f"{name}_{k}"] for k in range(sum(key.startswith(f"{name}_") for key in arrays.files))]
+
+            agent.mainQN.model.set_weights(load("main"))
+            agent.targetQN.model.set_weights(load("target"))
+
+            # The optimizer creates its slots on the first step
+            optimizer_state = load("optimizer")
+            if not agent.optimizer.built:
+                agent.optimizer.build(agent.mainQN.model.trainable_weights)
+
+            if len(optimizer_state) == len(agent.optimizer.variables):
+                for variable, value in zip(agent.optimizer.variables, optimizer_state):
+                    variable.assign(value)
+
+        if replay and entry.get("replay"):
+            records = np.load(os.path.join(self.directory, entry["replay"]), mmap_mode="r")
+            agent.episodeBuffer.restore(records, entry["replay_meta"])
+
+        agent.epsilon = entry["epsilon"]
+        agent.clear_q_cache()
+        return entry
+
+    def raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def wait(self):
+        """
+        Waits until every queued snapshot is written
+        """
+        self.snapshots.join()
+        self.raise_error()
+
+    def close(self):
+        """
+        Writes the queued snapshots and ends the writer thread
+        """
+        self.snapshots.put(None)
+        self.thread.join()
+        self.raise_error()
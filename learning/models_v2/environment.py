@@ -2,6 +2,7 @@ import os
 import blosum as bl
 from datetime import datetime
 from utils.encoder import get_codon_encoding, get_protein_encoding, get_table
+from utils.scoring import CODONS, INVALID_CODON, UNKNOWN_RESIDUE, build_codon_encoding, build_residue_encoding, build_score_table, codon_index, encode_dna, encode_protein, residue_index
 from utils.constants import GAP_EXTENSION_PENALTY, GAP_OPEN_PENALTY, FRAMESHIFT_PENALTY, Action
 from params import PARAMS
 from utils.aligner import ThreeFrameAligner
@@ -25,6 +26,14 @@ class Environment:
         self.table = get_table()
         self.encoded_proteins = get_protein_encoding()
         self.encoded_codons = get_codon_encoding(self.encoded_proteins, self.table)
+        self.score_table = build_score_table(self.rewards, self.table, default=0)
+
+        # One-hot rows by codon and residue index, codons and proteins without an encoding use TAG and '*'
+        self.codon_encoding = build_codon_encoding(self.encoded_codons, self.encoded_codons["TAG"])
+        self.residue_encoding = build_residue_encoding(self.encoded_proteins, self.encoded_proteins["*"])
+
+        # Translated residue index by codon index, invalid codons never translate
+        self.codon_residues = np.array([residue_index(self.table[codon]) for codon in CODONS + ["000"]] + [UNKNOWN_RESIDUE], dtype=np.int32)
 
         # Initial Pointers
         self.dna_pointer = 4
@@ -35,6 +44,9 @@ class Environment:
         # Alignment History
         self.alignment_history = []
 
+        # Memoized (score, reward, dna_move, protein_move) by (dna_pointer, protein_pointer, action), see step
+        self.transitions = {}
+
     def pad_sequences(self):
         """
         Pads the DNA and Protein Sequences
@@ -49,6 +61,19 @@ class Environment:
             # '*' + Protein + Pad
             self.protein_sequence = "-" + self.protein_sequence + ''.join(protein_pad)
 
+        self.encode_sequences()
+
+    def encode_sequences(self):
+        """
+        Encodes the padded DNA and Protein Sequences into codon and residue indices,
+        and into the one-hot rows that get_state slices from
+        """
+        self.dna_codons = encode_dna(self.dna_sequence)
+        self.protein_residues = encode_protein(self.protein_sequence)
+        self.transitions = {}
+        self.dna_one_hot = self.codon_encoding[self.dna_codons]
+        self.protein_one_hot = self.residue_encoding[self.protein_residues]
+
     def reset(self):
         """
         Resets the Environment, as well as the dna and protein pointers
@@ -100,51 +125,55 @@ class Environment:
         self.reset()
 
     def get_state(self):
-        state = []
-        encoded_proteins = get_protein_encoding()
-        encoded_codons = get_codon_encoding(encoded_proteins, get_table())
+        """
+        Returns Current state of environment
 
+        Returns:
+            NDArray: (4 + 4 * window_size, 23, 1) matrix of one-hot rows, sliced from the encodings of encode_sequences
+        """
         # NOTE: We considered Padded Codons: 000 == 00* == 0** == *00 == **0, where * is any nucleotide (A, C, T, G)
-
-        # Append Previous 3 Frames (3 Codons)
-        for i in range(self.dna_pointer - 4, self.dna_pointer - 1):
-           
-            # If the current codon contains a padding, append 000 instead
-            if(encoded_codons.get(self.get_codon_by_index(i)) is None):
-                state.append(encoded_codons["TAG"])
-            else:
-                state.append(encoded_codons[self.get_codon_by_index(i)])
-
-        # Append Previous Protein
-        if(encoded_proteins.get(self.protein_sequence[self.protein_pointer - 1]) is None):
-            state.append(encoded_proteins["*"])
-        else:
-            state.append(encoded_proteins[self.protein_sequence[self.protein_pointer - 1]])
-
-        # Append Current Window Frames (N Codons)
-        for i in range(self.dna_pointer - 1, self.dna_pointer + (self.window_size * 3) - 1):
-            
-            # If the current codon contains a padding, append 000 instead
-            if(encoded_codons.get(self.get_codon_by_index(i)) is None):
-                state.append(encoded_codons["TAG"])
-            else:
-                state.append(encoded_codons[self.get_codon_by_index(i)])
-
-        # Append Current Window Protein
-        for i in range(self.protein_pointer, self.protein_pointer + self.window_size):
-            if(encoded_proteins.get(self.protein_sequence[i]) is None):
-                state.append(encoded_proteins["*"])
-            else:
-                state.append(encoded_proteins[self.protein_sequence[i]])
-
-        # Convert to np array with Float Type
-        state = np.vstack(state).astype(np.float32)
+        window_end = self.dna_pointer + (self.window_size * 3) - 1
+
+        state = np.concatenate([
+            # Previous 3 Frames (3 Codons)
+            self.dna_one_hot[self.dna_pointer - 4 : self.dna_pointer - 1],
+            # Previous Protein
+            self.protein_one_hot[self.protein_pointer - 1 : self.protein_pointer],
+            # Current Window Frames (N Codons)
+            self.dna_one_hot[self.dna_pointer - 1 : window_end],
+            # Current Window Protein
+            self.protein_one_hot[self.protein_pointer : self.protein_pointer + self.window_size],
+        ])
 
         # Expand state
-        state = np.expand_dims(state, axis = -1)
-
-        return state
+        return state[..., np.newaxis]
     
+    def get_rollout_tables(self):
+        """
+        Returns the per-position tables of the current sequences that a compiled rollout replays step from,
+        see models_v2.rollout
+
+        Returns:
+            dict: int32 codon, translated residue and protein residue indices, float32 one-hot rows,
+                  the score table and the unpadded sequence lengths
+        """
+        # Translating an invalid codon raises in step, the rollout has no way to do the same mid-graph
+        if np.any(self.dna_codons == INVALID_CODON):
+            raise ValueError("Compiled rollouts need a DNA Sequence made of A, C, G and T only")
+
+        dna_codons = self.dna_codons.astype(np.int32)
+
+        return {
+            "dna_one_hot": self.dna_one_hot,
+            "protein_one_hot": self.protein_one_hot,
+            "dna_codons": dna_codons,
+            "dna_residues": self.codon_residues[dna_codons],
+            "protein_residues": self.protein_residues.astype(np.int32),
+            "score_table": self.score_table.astype(np.int32),
+            "dna_len": np.int32(self.dna_len),
+            "protein_len": np.int32(self.protein_len),
+        }
+
     def get_codon_by_index(self, index):
         return "000" if "0" in self.dna_sequence[index : index + 3] else self.dna_sequence[index : index + 3]
 
@@ -156,7 +185,7 @@ class Environment:
         Performs the chosen action on the environment and moves the pointers accordingly
 
         Args:
-            action (int, optional): Chosen Action (0 to 3). Defaults to 0.
+            action (int, optional): Chosen Action (0 to 5). Defaults to 0.
 
         Returns:
             score: Alignment score of the action
@@ -164,12 +193,48 @@ class Environment:
             Done: If it was the last action in the environment
             Next_State: Next current state following the action
         """
-        score = 0
-        reward = 0
-
         if record:
             self.add_to_history(action)
 
+        # Transitions only depend on the pointers, so they are memoized per sequence pair
+        key = (self.dna_pointer, self.protein_pointer, action)
+        transition = self.transitions.get(key)
+        if transition is None:
+            transition = self.transitions[key] = self.get_transition(action)
+
+        score, reward, dna_move, protein_move = transition
+        self.dna_pointer += dna_move
+        self.protein_pointer += protein_move
+
+        done = self.isDone()
+
+        next_state = np.zeros(shape=PARAMS['input_shape']) if done else self.get_state()
+
+        # print(self.dna_pointer, ", ", self.protein_pointer, "\n")
+
+        if record:
+            self.alignment_history[-1]["reward"] = reward
+
+        return score, reward, done, next_state
+
+    def get_transition(self, action=0):
+        """
+        Computes the outcome of an action from the current pointers without moving them
+
+        Args:
+            action (int, optional): Chosen Action (0 to 5). Defaults to 0.
+
+        Returns:
+            score: Alignment score of the action
+            reward: Reward for the action
+            dna_move: Number of nucleotides the DNA pointer moves
+            protein_move: Number of characters the protein pointer moves
+        """
+        score = 0
+        reward = 0
+        dna_move = 0
+        protein_move = 0
+
         # MATCH
         if action == 0:
             codon = self.get_codon_by_index(self.dna_pointer)
@@ -179,19 +244,19 @@ class Environment:
             if(protein == '*'):
                 score += 0
                 reward = -2
-                self.dna_pointer += 3
+                dna_move += 3
 
             # If they match, set reward
             else:
-                score += self.blosum_lookup(codon, protein)
+                score += self.score(self.dna_pointer, self.protein_pointer)
                 reward += 0 if (validate(
                     action=action, 
                     curr_frame=self.table[codon], 
                     protein=protein
                 )) else -2
-                self.dna_pointer += 3
+                dna_move += 3
             
-            self.protein_pointer += 1
+            protein_move += 1
 
         # FRAMESHIFT 1
         elif action == 1:
@@ -201,7 +266,7 @@ class Environment:
             if(protein == '*'):
                 score += 0
                 reward = -2
-                self.dna_pointer += 2
+                dna_move += 2
 
             # Apply Deletion
             else:
@@ -210,16 +275,16 @@ class Environment:
                 frame_2 = self.get_codon_by_index(self.dna_pointer)
                 frame_3 = self.get_codon_by_index(self.dna_pointer + 1)
 
-                score += self.blosum_lookup(frame_1, protein) - FRAMESHIFT_PENALTY
+                score += self.score(self.dna_pointer - 1, self.protein_pointer) - FRAMESHIFT_PENALTY
                 reward += 0 if (validate(
                     action=action,
                     curr_frames=[self.table[frame_1],self.table[frame_2],self.table[frame_3]], 
                     protein=protein
                 )) else -2
 
-                self.dna_pointer += 2
+                dna_move += 2
             
-            self.protein_pointer += 1
+            protein_move += 1
 
         # FRAMESHIFT 3
         elif action == 2:
@@ -230,7 +295,7 @@ class Environment:
             if(protein == '*'):
                 score += 0
                 reward = -2
-                self.dna_pointer += 4
+                dna_move += 4
 
             # Apply Insertion
             else:
@@ -238,15 +303,15 @@ class Environment:
                 frame_1 = self.get_codon_by_index(self.dna_pointer - 1)
                 frame_2 = self.get_codon_by_index(self.dna_pointer)
                 frame_3 = self.get_codon_by_index(self.dna_pointer + 1)
-                score += self.blosum_lookup(codon, protein) - FRAMESHIFT_PENALTY
+                score += self.score(self.dna_pointer + 1, self.protein_pointer) - FRAMESHIFT_PENALTY
                 reward += 0 if (validate(
                     action=action,
                     curr_frames=[self.table[frame_1],self.table[frame_2],self.table[frame_3]], 
                     protein=protein
                 )) else -2
-                self.dna_pointer += 4
+                dna_move += 4
             
-            self.protein_pointer += 1
+            protein_move += 1
         
         # INSERTION or DELETION
         elif action == 3 or action == 4:
@@ -265,35 +330,35 @@ class Environment:
             curr_frames=[self.table[frame_1],self.table[frame_2],self.table[frame_3]]
             # Insertion scores
             scores_1 = [
-                self.blosum_lookup(frame_1, prev_protein) - (GAP_OPEN_PENALTY + GAP_EXTENSION_PENALTY ), 
-                self.blosum_lookup(frame_2, prev_protein)  - (GAP_OPEN_PENALTY + GAP_EXTENSION_PENALTY), 
-                self.blosum_lookup(frame_3, prev_protein)  - (GAP_OPEN_PENALTY + GAP_EXTENSION_PENALTY )
+                self.score(self.dna_pointer - 1, self.protein_pointer - 1) - (GAP_OPEN_PENALTY + GAP_EXTENSION_PENALTY ), 
+                self.score(self.dna_pointer, self.protein_pointer - 1)  - (GAP_OPEN_PENALTY + GAP_EXTENSION_PENALTY), 
+                self.score(self.dna_pointer + 1, self.protein_pointer - 1)  - (GAP_OPEN_PENALTY + GAP_EXTENSION_PENALTY )
             ]
 
             # Deletion scores
             scores_2 = [
-                self.blosum_lookup(frame_a, curr_protein) - (GAP_OPEN_PENALTY + GAP_EXTENSION_PENALTY ), 
-                self.blosum_lookup(frame_b, curr_protein)  - (GAP_OPEN_PENALTY + GAP_EXTENSION_PENALTY), 
-                self.blosum_lookup(frame_c, curr_protein)  - (GAP_OPEN_PENALTY + GAP_EXTENSION_PENALTY )
+                self.score(self.dna_pointer - 4, self.protein_pointer) - (GAP_OPEN_PENALTY + GAP_EXTENSION_PENALTY ), 
+                self.score(self.dna_pointer - 3, self.protein_pointer)  - (GAP_OPEN_PENALTY + GAP_EXTENSION_PENALTY), 
+                self.score(self.dna_pointer - 2, self.protein_pointer)  - (GAP_OPEN_PENALTY + GAP_EXTENSION_PENALTY )
             ]
 
             if(prev_protein == '*' and action == 3):
                 score += 0
                 reward = -2
-                self.dna_pointer += 3
-                self.dna_pointer += 1
+                dna_move += 3
+                dna_move += 1
 
             elif(curr_protein == '*' and action == 4):
                 score += 0
                 reward = -2
-                self.dna_pointer += 3
-                self.dna_pointer += 1
+                dna_move += 3
+                dna_move += 1
 
             elif(curr_protein in curr_frames):
                 score += 0
                 reward = -2
-                self.dna_pointer += 3
-                self.dna_pointer += 1
+                dna_move += 3
+                dna_move += 1
 
             else:
                 cond = max(scores_1) <= max(scores_2)
@@ -313,10 +378,10 @@ class Environment:
                 )
                 
                 # Move Right if Insertion
-                self.dna_pointer += (2 + np.argmax(scores_2)) if (action == 3) else 0
+                dna_move += (2 + np.argmax(scores_2)) if (action == 3) else 0
 
                 # Move Down if Deletion
-                self.protein_pointer += 1 if (action == 4) else 0
+                protein_move += 1 if (action == 4) else 0
                 
                 score += max(scores_1) if (cond and cond_2) else max(scores_2)
                 
@@ -344,23 +409,23 @@ class Environment:
             prev_protein = self.protein_sequence[self.protein_pointer - 1]
 
             scores = [
-                self.blosum_lookup(frame_1, curr_protein) - FRAMESHIFT_PENALTY,
-                self.blosum_lookup(frame_2, curr_protein),
-                self.blosum_lookup(frame_3, curr_protein) - FRAMESHIFT_PENALTY
+                self.score(self.dna_pointer - 1, self.protein_pointer) - FRAMESHIFT_PENALTY,
+                self.score(self.dna_pointer, self.protein_pointer),
+                self.score(self.dna_pointer + 1, self.protein_pointer) - FRAMESHIFT_PENALTY
             ]
 
             # Insertion scores
             scores_1 = [
-                self.blosum_lookup(frame_1, prev_protein) - (GAP_OPEN_PENALTY + GAP_EXTENSION_PENALTY ), 
-                self.blosum_lookup(frame_2, prev_protein)  - (GAP_OPEN_PENALTY + GAP_EXTENSION_PENALTY), 
-                self.blosum_lookup(frame_3, prev_protein)  - (GAP_OPEN_PENALTY + GAP_EXTENSION_PENALTY)
+                self.score(self.dna_pointer - 1, self.protein_pointer - 1) - (GAP_OPEN_PENALTY + GAP_EXTENSION_PENALTY ), 
+                self.score(self.dna_pointer, self.protein_pointer - 1)  - (GAP_OPEN_PENALTY + GAP_EXTENSION_PENALTY), 
+                self.score(self.dna_pointer + 1, self.protein_pointer - 1)  - (GAP_OPEN_PENALTY + GAP_EXTENSION_PENALTY)
             ]
             
             # Deletion scores
             scores_2 = [
-                self.blosum_lookup(frame_a, curr_protein) - (GAP_OPEN_PENALTY + GAP_EXTENSION_PENALTY ), 
-                self.blosum_lookup(frame_b, curr_protein) - (GAP_OPEN_PENALTY + GAP_EXTENSION_PENALTY), 
-                self.blosum_lookup(frame_c, curr_protein) - (GAP_OPEN_PENALTY + GAP_EXTENSION_PENALTY)
+                self.score(self.dna_pointer - 4, self.protein_pointer) - (GAP_OPEN_PENALTY + GAP_EXTENSION_PENALTY ), 
+                self.score(self.dna_pointer - 3, self.protein_pointer) - (GAP_OPEN_PENALTY + GAP_EXTENSION_PENALTY), 
+                self.score(self.dna_pointer - 2, self.protein_pointer) - (GAP_OPEN_PENALTY + GAP_EXTENSION_PENALTY)
             ]
 
             score += max(max(scores,scores_1,scores_2))
@@ -374,24 +439,15 @@ class Environment:
                 curr_frames=[self.table[frame_1], self.table[frame_2], self.table[frame_3]]
             )) else -2
 
-            self.dna_pointer += np.argmax([
-                self.blosum_lookup(frame_1, curr_protein) - FRAMESHIFT_PENALTY,
-                self.blosum_lookup(frame_2, curr_protein),
-                self.blosum_lookup(frame_3, curr_protein) - FRAMESHIFT_PENALTY
+            dna_move += np.argmax([
+                self.score(self.dna_pointer - 1, self.protein_pointer) - FRAMESHIFT_PENALTY,
+                self.score(self.dna_pointer, self.protein_pointer),
+                self.score(self.dna_pointer + 1, self.protein_pointer) - FRAMESHIFT_PENALTY
             ]) + 2
 
-            self.protein_pointer += 1
+            protein_move += 1
 
-        done = self.isDone()
-
-        next_state = np.zeros(shape=PARAMS['input_shape']) if done else self.get_state()
-
-        # print(self.dna_pointer, ", ", self.protein_pointer, "\n")
-
-        if record:
-            self.alignment_history[-1]["reward"] = reward
-
-        return score, reward, done, next_state
+        return score, reward, int(dna_move), protein_move
 
     def blosum_lookup(self, codon, protein):
         """
@@ -407,7 +463,20 @@ class Environment:
         if codon == "*":
             return 0
 
-        return self.rewards[self.table[codon]][protein]
+        return int(self.score_table[codon_index(codon), residue_index(protein)])
+
+    def score(self, dna_index, protein_index):
+        """
+        Gets score of the codon starting at dna_index against the protein at protein_index
+
+        Args:
+            dna_index: Index of the codon's first nucleotide in the padded DNA sequence
+            protein_index : Index of the target protein character in the padded protein sequence
+
+        Returns:
+            score: Returns score from the precompiled score table
+        """
+        return int(self.score_table[self.dna_codons[dna_index], self.protein_residues[protein_index]])
 
     def print_frames(self, action):
         """
@@ -1,21 +1,96 @@
-import random
-from collections import deque
+import threading
 import numpy as np
+from models_v2.sum_tree import SumTree
+
+
+def encode_states(states):
+    """
+    Encodes a batch of states as one uint8 code per row, 0 for an all-zero row (finished episodes)
+    and c + 1 for a one-hot row with a one at column c
+
+    Parameters:
+    - states (np.array): (batch, rows, features, 1) states of one-hot or all-zero rows.
+
+    Returns:
+    - (batch, rows) uint8 codes.
+    """
+    states = np.asarray(states)
+    rows = states.reshape(states.shape[:3])
+    sums = rows.sum(axis=2)
+
+    if np.any((sums != 0) & (sums != 1)) or np.any((rows != 0) & (rows != 1)):
+        raise ValueError("Experience_Buffer only stores states made of one-hot or all-zero rows")
+
+    return np.where(sums == 0, 0, rows.argmax(axis=2) + 1).astype(np.uint8)
 
 class Experience_Buffer:
     def __init__(self, capacity, batch_size=50000):
         """
         Initialize the replay buffer with a given capacity.
+        Transitions are kept in preallocated ring buffers, states are stored as the column index of every one-hot row.
 
         Parameters:
         - capacity (int): The maximum number of transitions to store in the buffer.
         """
-        self.buffer = deque(maxlen=capacity)
+        self.capacity = capacity
         self.batchSize = batch_size
 
+        # Next slot to write and number of stored transitions
+        self.position = 0
+        self.size = 0
+
+        self.actions = np.zeros(capacity, dtype=np.uint8)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.dones = np.zeros(capacity, dtype=bool)
+
+        # Allocated on the first add, once the state shape is known
+        self.states = None
+        self.next_states = None
+        self.state_shape = None
+        self.decoding = None
+
+    def allocate(self, state_shape):
+        """
+        Allocates the state ring buffers for states of the given shape, (rows, features, 1) one-hot rows
+
+        Parameters:
+        - state_shape (tuple): Shape of a single state.
+        """
+        rows, features = state_shape[0], state_shape[1]
+        self.state_shape = tuple(state_shape)
+        self.states = np.zeros((self.capacity, rows), dtype=np.uint8)
+        self.next_states = np.zeros((self.capacity, rows), dtype=np.uint8)
+
+        # Code 0 is an all-zero row (finished episodes), code c + 1 is a one at column c
+        self.decoding = np.vstack([np.zeros((1, features), dtype=np.float32), np.eye(features, dtype=np.float32)])
+
+    def encode(self, state):
+        """
+        Encodes a state as one uint8 code per row, see encode_states
+
+        Parameters:
+        - state (np.array): State of one-hot or all-zero rows.
+
+        Returns:
+        - (rows,) uint8 codes.
+        """
+        return encode_states(np.reshape(state, (1,) + self.state_shape))[0]
+
+    def decode(self, codes):
+        """
+        Decodes a batch of state codes back into float32 states
+
+        Parameters:
+        - codes (np.array): (batch, rows) state codes.
+
+        Returns:
+        - (batch,) + state shape float32 states.
+        """
+        return self.decoding[codes].reshape((len(codes),) + self.state_shape)
+
     def add(self, state, action, reward, next_state, done):
         """
-        Add a new transition to the buffer.
+        Add a new transition to the buffer, overwriting the oldest one once the buffer is full.
 
         Parameters:
         - state (np.array): The starting state.
@@ -24,11 +99,113 @@ class Experience_Buffer:
         - next_state (np.array): The next state.
         - done (bool): Whether the episode has finished.
         """
-        self.buffer.append((state, action, reward, next_state, done))
+        if self.states is None:
+            self.allocate(np.shape(state))
+
+        k = self.position
+        self.states[k] = self.encode(state)
+        self.next_states[k] = self.encode(next_state)
+        self.actions[k] = action
+        self.rewards[k] = reward
+        self.dones[k] = done
+
+        self.position = (k + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def add_encoded(self, states, actions, rewards, next_states, dones):
+        """
+        Add a batch of transitions whose states are already encoded by encode_states.
+        The buffer must have been allocated, either by allocate or by an earlier add.
+
+        Parameters:
+        - states (np.array): (batch, rows) codes of the starting states.
+        - actions (np.array): The actions taken.
+        - rewards (np.array): The rewards received.
+        - next_states (np.array): (batch, rows) codes of the next states.
+        - dones (np.array): Whether the episodes have finished.
+
+        Returns:
+        - The slots the transitions were written to.
+        """
+        if self.states is None:
+            raise ValueError("Experience_Buffer must be allocated before adding encoded states")
+
+        # Only the newest capacity transitions survive a larger batch
+        n = min(len(actions), self.capacity)
+        slots = (self.position + np.arange(n)) % self.capacity
+
+        self.states[slots] = states[-n:]
+        self.next_states[slots] = next_states[-n:]
+        self.actions[slots] = actions[-n:]
+        self.rewards[slots] = rewards[-n:]
+        self.dones[slots] = dones[-n:]
+
+        self.position = (self.position + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+        return slots
+
+    def record_dtype(self):
+        """
+        Structured dtype of one transition as stored by snapshot
+        """
+        rows = self.state_shape[0]
+        return np.dtype([
+            ("state", np.uint8, (rows,)),
+            ("next_state", np.uint8, (rows,)),
+            ("action", np.uint8),
+            ("reward", np.float32),
+            ("done", bool),
+        ])
+
+    def ordered_slots(self):
+        """
+        Returns the slots of the stored transitions, oldest first
+        """
+        return (self.position - self.size + np.arange(self.size)) % self.capacity
+
+    def snapshot(self):
+        """
+        Copies the stored transitions for persisting, see restore
+
+        Returns:
+        - records (np.array): One record_dtype record per transition, oldest first. None if the buffer is empty.
+        - meta (dict): JSON serializable values restore needs besides the records.
+        """
+        if self.size == 0:
+            return None, None
+
+        slots = self.ordered_slots()
+        records = np.zeros(self.size, dtype=self.record_dtype())
+        records["state"] = self.states[slots]
+        records["next_state"] = self.next_states[slots]
+        records["action"] = self.actions[slots]
+        records["reward"] = self.rewards[slots]
+        records["done"] = self.dones[slots]
+
+        return records, {"state_shape": list(self.state_shape)}
+
+    def restore(self, records, meta):
+        """
+        Replaces the contents of the buffer with persisted transitions, keeping the newest ones that fit
+
+        Parameters:
+        - records (np.array): Records from snapshot, e.g. a memory-mapped .npy file.
+        - meta (dict): Metadata from snapshot.
+
+        Returns:
+        - The slots the transitions were written to.
+        """
+        self.allocate(tuple(meta["state_shape"]))
+        self.position = 0
+        self.size = 0
+
+        # Only the tail of a memory-mapped file is read when it holds more than capacity transitions
+        records = records[-self.capacity:]
+        return self.add_encoded(records["state"], records["action"], records["reward"], records["next_state"], records["done"])
 
     def sample(self, batch_size):
         """
-        Sample a batch of transitions from the buffer.
+        Sample a batch of distinct transitions from the buffer.
 
         Parameters:
         - batch_size (int): The size of the batch to sample.
@@ -36,9 +213,28 @@ class Experience_Buffer:
         Returns:
         - A list of tuples containing states, actions, rewards, next_states, and dones.
         """
-        mini_batch = random.sample(self.buffer, batch_size)
-        states, actions, rewards, next_states, dones = map(np.array, zip(*mini_batch))
-        return states, actions, rewards, next_states, dones
+        if batch_size > self.size:
+            raise ValueError("Sample larger than population")
+
+        indices = self.sample_indices(batch_size)
+
+        states = self.decode(self.states[indices])
+        next_states = self.decode(self.next_states[indices])
+        return states, self.actions[indices].astype(np.int64), self.rewards[indices], next_states, self.dones[indices]
+
+    def sample_indices(self, batch_size):
+        """
+        Draws batch_size distinct slots, redrawing the rare batches with repeats
+        instead of permuting the whole buffer
+        """
+        # Repeats stop being rare once batch_size ** 2 nears the buffer size
+        if batch_size * batch_size > self.size:
+            return np.random.choice(self.size, size=batch_size, replace=False)
+
+        while True:
+            indices = np.random.randint(0, self.size, size=batch_size)
+            if len(np.unique(indices)) == batch_size:
+                return indices
 
     def __len__(self):
         """
@@ -47,4 +243,137 @@ class Experience_Buffer:
         Returns:
         - The number of transitions in the buffer.
         """
-        return len(self.buffer)
+        return self.size
+
+
+class Prioritized_Experience_Buffer(Experience_Buffer):
+    def __init__(self, capacity, alpha=0.6, beta=0.4, beta_increment=0.001, epsilon=1e-3, batch_size=50000):
+        """
+        Initialize a prioritized replay buffer, transitions are sampled in proportion to priority ** alpha
+        from a sum-tree and weighted by importance sampling.
+
+        Parameters:
+        - capacity (int): The maximum number of transitions to store in the buffer.
+        - alpha (float): How much priorities skew sampling, 0 is uniform.
+        - beta (float): Starting importance sampling exponent, annealed to 1.
+        - beta_increment (float): Increase of beta on every sample.
+        - epsilon (float): Added to every TD-error so no transition stops being sampled.
+        """
+        super().__init__(capacity, batch_size)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.epsilon = epsilon
+        self.tree = SumTree(capacity)
+
+        # New transitions get the largest priority seen so they are replayed at least once
+        self.max_priority = 1.0
+
+        # Priorities may be refreshed by a background learner while transitions are added
+        self.lock = threading.Lock()
+
+    def add(self, state, action, reward, next_state, done):
+        """
+        Add a new transition to the buffer with the largest priority seen so far.
+        """
+        with self.lock:
+            position = self.position
+            super().add(state, action, reward, next_state, done)
+            self.tree.update(position, self.max_priority)
+
+    def add_encoded(self, states, actions, rewards, next_states, dones):
+        """
+        Add a batch of encoded transitions with the largest priority seen so far, see Experience_Buffer.add_encoded.
+        """
+        with self.lock:
+            slots = super().add_encoded(states, actions, rewards, next_states, dones)
+            self.tree.update(slots, np.full(len(slots), self.max_priority))
+            return slots
+
+    def record_dtype(self):
+        """
+        Structured dtype of one transition as stored by snapshot, with its priority
+        """
+        return np.dtype(super().record_dtype().descr + [("priority", np.float64)])
+
+    def snapshot(self):
+        """
+        Copies the stored transitions with their priorities, see Experience_Buffer.snapshot
+        """
+        with self.lock:
+            records, meta = super().snapshot()
+            if records is None:
+                return None, None
+
+            records["priority"] = self.tree.get(self.ordered_slots())
+            meta.update(beta=self.beta, max_priority=self.max_priority)
+            return records, meta
+
+    def restore(self, records, meta):
+        """
+        Replaces the contents of the buffer with persisted transitions, see Experience_Buffer.restore.
+        Transitions persisted without priorities get the largest priority of the file.
+        """
+        self.tree = SumTree(self.capacity)
+        self.max_priority = meta.get("max_priority", 1.0)
+        self.beta = meta.get("beta", self.beta)
+
+        slots = super().restore(records, meta)
+
+        if "priority" in records.dtype.names:
+            with self.lock:
+                self.tree.update(slots, records["priority"][-len(slots):])
+
+        return slots
+
+    def sample_indices(self, batch_size):
+        """
+        Draws one slot from each of batch_size equal slices of the total priority
+        """
+        bounds = np.linspace(0, self.tree.total, batch_size + 1)
+        values = np.random.uniform(bounds[:-1], bounds[1:])
+        return np.minimum(self.tree.find(values), self.size - 1)
+
+    def sample(self, batch_size):
+        """
+        Sample a batch of transitions in proportion to their priorities.
+
+        Parameters:
+        - batch_size (int): The size of the batch to sample.
+
+        Returns:
+        - states, actions, rewards, next_states, dones as in Experience_Buffer.sample, followed by
+          the sampled slots for update_priorities and the float32 importance sampling weights.
+        """
+        if batch_size > self.size:
+            raise ValueError("Sample larger than population")
+
+        with self.lock:
+            indices = self.sample_indices(batch_size)
+            priorities = self.tree.get(indices)
+            total = self.tree.total
+
+        # Importance sampling weights, normalized by the largest weight of the batch
+        probabilities = priorities / total
+        weights = (self.size * probabilities) ** -self.beta
+        weights = (weights / weights.max()).astype(np.float32)
+        self.beta = min(1.0, self.beta + self.beta_increment)
+
+        states = self.decode(self.states[indices])
+        next_states = self.decode(self.next_states[indices])
+        return (states, self.actions[indices].astype(np.int64), self.rewards[indices], next_states, self.dones[indices],
+                indices, weights)
+
+    def update_priorities(self, indices, td_errors):
+        """
+        Refreshes the priorities of sampled transitions from their new TD-errors.
+
+        Parameters:
+        - indices (np.array): Slots returned by sample.
+        - td_errors (np.array): TD-error of every slot.
+        """
+        priorities = (np.abs(td_errors) + self.epsilon) ** self.alpha
+
+        with self.lock:
+            self.max_priority = max(self.max_priority, float(priorities.max()))
+            self.tree.update(indices, priorities)
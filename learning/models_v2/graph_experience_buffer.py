@@ -0,0 +1,101 @@
+import numpy as np
+import tensorflow as tf
+from models_v2.experience_buffer import Experience_Buffer
+
+
+class Graph_Experience_Buffer(Experience_Buffer):
+    def __init__(self, capacity, batch_size=50000):
+        """
+        Initialize a replay buffer that mirrors its transitions into tf.Variable storage, so a compiled train step
+        samples and decodes batches in the graph. The NumPy ring buffers stay the reference copy used by snapshot and
+        restore, new transitions are copied to the variables in one scatter per flush.
+
+        Parameters:
+        - capacity (int): The maximum number of transitions to store in the buffer.
+        """
+        super().__init__(capacity, batch_size)
+
+        # Slots written since the last flush
+        self.dirty = np.zeros(capacity, dtype=bool)
+
+        # Created with allocate, once the state shape is known
+        self.graph_states = None
+
+    def allocate(self, state_shape):
+        """
+        Allocates the state ring buffers and their variables, see Experience_Buffer.allocate.
+        Reallocating with the same shape keeps the variables, which compiled train steps have captured.
+        """
+        if self.graph_states is not None and tuple(state_shape) != self.state_shape:
+            raise ValueError("Graph_Experience_Buffer cannot change its state shape once allocated")
+
+        super().allocate(state_shape)
+        self.dirty[:] = True
+
+        if self.graph_states is None:
+            rows = self.state_shape[0]
+            self.graph_states = tf.Variable(tf.zeros((self.capacity, rows), dtype=tf.uint8), trainable=False)
+            self.graph_next_states = tf.Variable(tf.zeros((self.capacity, rows), dtype=tf.uint8), trainable=False)
+            self.graph_actions = tf.Variable(tf.zeros(self.capacity, dtype=tf.int32), trainable=False)
+            self.graph_rewards = tf.Variable(tf.zeros(self.capacity, dtype=tf.float32), trainable=False)
+            self.graph_dones = tf.Variable(tf.zeros(self.capacity, dtype=tf.float32), trainable=False)
+            self.graph_size = tf.Variable(0, dtype=tf.int32, trainable=False)
+            self.graph_decoding = tf.constant(self.decoding)
+
+    def add(self, state, action, reward, next_state, done):
+        """
+        Add a new transition to the buffer, see Experience_Buffer.add
+        """
+        k = self.position
+        super().add(state, action, reward, next_state, done)
+        self.dirty[k] = True
+
+    def add_encoded(self, states, actions, rewards, next_states, dones):
+        """
+        Add a batch of encoded transitions, see Experience_Buffer.add_encoded
+        """
+        slots = super().add_encoded(states, actions, rewards, next_states, dones)
+        self.dirty[slots] = True
+        return slots
+
+    def flush(self):
+        """
+        Copies the transitions written since the last flush into the variables
+        """
+        if self.graph_states is None:
+            return
+
+        slots = np.flatnonzero(self.dirty)
+        if len(slots) > 0:
+            indices = slots[:, np.newaxis]
+            self.graph_states.scatter_nd_update(indices, self.states[slots])
+            self.graph_next_states.scatter_nd_update(indices, self.next_states[slots])
+            self.graph_actions.scatter_nd_update(indices, self.actions[slots].astype(np.int32))
+            self.graph_rewards.scatter_nd_update(indices, self.rewards[slots])
+            self.graph_dones.scatter_nd_update(indices, self.dones[slots].astype(np.float32))
+            self.dirty[:] = False
+
+        self.graph_size.assign(self.size)
+
+    def sample_graph(self, batch_size):
+        """
+        Samples a batch in the graph, uniformly with replacement. Only sees transitions up to the last flush.
+
+        Parameters:
+        - batch_size (int): The size of the batch to sample.
+
+        Returns:
+        - Tensors of states, actions, rewards, next_states and dones.
+        """
+        indices = tf.random.uniform([batch_size], 0, self.graph_size, dtype=tf.int32)
+        shape = (batch_size,) + self.state_shape
+
+        def decode(codes):
+            return tf.reshape(tf.gather(self.graph_decoding, tf.cast(codes, tf.int32)), shape)
+
+        states = decode(tf.gather(self.graph_states, indices))
+        next_states = decode(tf.gather(self.graph_next_states, indices))
+        actions = tf.gather(self.graph_actions, indices)
+        rewards = tf.gather(self.graph_rewards, indices)
+        dones = tf.gather(self.graph_dones, indices)
+        return states, actions, rewards, next_states, dones
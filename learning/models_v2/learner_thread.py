@@ -0,0 +1,87 @@
+import queue
+import threading
+import time
+
+
+class LearnerThread():
+
+    def __init__(self, train_on_batch, queue_size: int = 4):
+        """
+        Initialize a background thread that runs gradient steps on sampled batches, so stepping the environment
+        overlaps with TensorFlow compute, which releases the GIL
+
+        Args:
+            train_on_batch: Function that takes one sampled batch and runs a gradient step on it
+            queue_size (int, optional): Batches waiting at most, submit blocks beyond that. Defaults to 4.
+        """
+        self.train_on_batch = train_on_batch
+        self.batches = queue.Queue(maxsize=queue_size)
+        self.error = None
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            batch = self.batches.get()
+            try:
+                if batch is None:
+                    return
+
+                # A failed step is raised by the next submit or sync, later batches are dropped
+                if self.error is None:
+                    self.train_on_batch(batch)
+
+            except Exception as error:
+                self.error = error
+
+            finally:
+                self.batches.task_done()
+
+    def raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def submit(self, batch):
+        """
+        Queues a batch for the next gradient step, waiting while the queue is full
+        """
+        self.raise_error()
+        self.batches.put(batch)
+
+    def sync(self):
+        """
+        Waits until every queued batch has been trained on
+        """
+        self.batches.join()
+        self.raise_error()
+
+    def stop(self):
+        """
+        Trains on the queued batches and ends the thread
+        """
+        self.batches.put(None)
+        self.thread.join()
+        self.raise_error()
+
+
+class ThroughputCounter():
+
+    def __init__(self):
+        """
+        Initialize a counter of steps per second since the last reset
+        """
+        self.reset()
+
+    def reset(self):
+        self.steps = 0
+        self.start = time.perf_counter()
+
+    def add(self, steps: int = 1):
+        self.steps += steps
+
+    @property
+    def per_second(self):
+        elapsed = time.perf_counter() - self.start
+        return self.steps / elapsed if elapsed > 0 else 0.0
@@ -8,8 +8,16 @@ from keras.optimizers import Adam
 # from models.experience_buffer import Experience_Buffer
 # from models.network import DDDQN
 from models_v2.environment import Environment
-from models_v2.experience_buffer import Experience_Buffer
+from models_v2.vec_environment import VecEnvironment
+from models_v2.experience_buffer import Experience_Buffer, Prioritized_Experience_Buffer
+from models_v2.graph_experience_buffer import Graph_Experience_Buffer
 from models_v2.network import DDDQN
+from models_v2.numpy_network import NumpyDDDQN
+from models_v2.q_value_cache import QValueCache
+from models_v2.learner_thread import LearnerThread, ThroughputCounter
+from models_v2.rollout import build_greedy_rollout
+from models_v2.student import StudentPolicy
+from models_v2.bulk_explore import random_episodes
 
 class Agent():
 
@@ -38,10 +46,58 @@ class Agent():
         self.batchSize = params['batch_size']
         self.train_freq = params['train_freq']
 
-        self.episodeBuffer = Experience_Buffer(self.bufferSize)
+        # Prioritized replay samples transitions by TD-error instead of uniformly
+        self.prioritized = params.get('prioritized_replay', False)
+        if self.prioritized:
+            self.episodeBuffer = Prioritized_Experience_Buffer(
+                self.bufferSize,
+                alpha=params.get('per_alpha', 0.6),
+                beta=params.get('per_beta', 0.4),
+                beta_increment=params.get('per_beta_increment', 0.001),
+            )
+        elif params.get('graph_replay', False):
+            self.episodeBuffer = Graph_Experience_Buffer(self.bufferSize)
+        else:
+            self.episodeBuffer = Experience_Buffer(self.bufferSize)
         self.episode = 0
         self.total_steps = 0
 
+        # Environments used by test_batch
+        self.test_envs = []
+
+        # NumPy copy of the main network used for test actions, see load_inference_weights
+        self.inference_qn = None
+
+        # Distilled student used for test actions instead of the main network, see load_student
+        self.student = None
+
+        # Compiled greedy rollouts by jit_compile, see rollout
+        self.rollout_fns = {}
+
+        # Q-values of the main network by state, cleared whenever its weights change. Disabled when the size is 0.
+        q_cache_size = params.get('q_cache_size', 0)
+        self.q_cache = QValueCache(q_cache_size) if q_cache_size > 0 else None
+
+        # Gradient steps run on a background thread when enabled, see train and sync_learner
+        self.learner = LearnerThread(self.train_on_batch, params.get('learner_queue_size', 4)) if params.get('async_learner', False) else None
+
+        # Environment and gradient steps per second, see throughput
+        self.env_counter = ThroughputCounter()
+        self.train_counter = ThroughputCounter()
+
+        # Target evaluation, gradient step and Polyak update compiled into one graph, optionally with XLA
+        self.jit_compile = params.get('jit_compile', False)
+        self.train_tau = params.get('train_tau', 0.0)
+        self.train_step = tf.function(self.train_step_fn, jit_compile=self.jit_compile)
+        self.polyak_update = tf.function(self.polyak_update_fn, jit_compile=self.jit_compile)
+
+        # Replay kept in tf.Variable storage and sampled inside the compiled train step, several updates per train call
+        self.graph_replay = params.get('graph_replay', False)
+        self.updates_per_train = params.get('updates_per_train', 1)
+        if self.graph_replay and (self.prioritized or self.learner is not None):
+            raise ValueError("graph_replay cannot be combined with prioritized_replay or async_learner")
+        self.graph_train_step = tf.function(self.graph_train_step_fn, jit_compile=self.jit_compile)
+
 
     def reset(self):
         """
@@ -86,10 +142,48 @@ class Agent():
             total_score += score
 
             self.total_steps += 1
+            self.env_counter.add()
 
         return total_score, total_reward, self.total_steps
     
 
+    def play_batch(self, vec_env : VecEnvironment, steps : int):
+        """
+        Agent interacts with every slot of a vectorized environment for a number of steps,
+        choosing the actions of all slots with one forward pass of the main network per step
+
+        Args:
+            vec_env (VecEnvironment): Environment slots, finished slots are reloaded by the environment
+            steps (int): Number of steps taken in every slot
+
+        Returns:
+            Finished Episodes: (score, reward, steps) of every episode finished while playing
+        """
+        states = vec_env.get_states()
+
+        for _ in range(steps):
+            # Get predicted actions
+            actions = self.get_actions(states)
+
+            # Get results of actions
+            _, rewards, dones, next_states = vec_env.step(actions)
+
+            # Train main_network once every train_freq transitions
+            for k in range(len(vec_env)):
+                if(self.total_steps > 0 and self.total_steps % self.train_freq == 0):
+                    self.train()
+
+                # Append to Buffer
+                self.episodeBuffer.add(states[k], actions[k], rewards[k], next_states[k], dones[k])
+                self.total_steps += 1
+
+            self.env_counter.add(len(vec_env))
+
+            states = vec_env.get_states()
+
+        return vec_env.pop_finished()
+
+
     def explore(self, reps : int = 1):
         """
         Lets the agent perform random actions for a fixed number of episodes
@@ -109,40 +203,203 @@ class Agent():
                     self.train()
 
                 self.episodeBuffer.add(state, action, reward, next_state, done)
+                self.env_counter.add()
                 steps += 1
 
             self.env.reset()
             steps = 0
 
 
+    def explore_pairs(self, pairs : list):
+        """
+        Lets the agent perform random actions for one episode of every pair at once, see bulk_explore.random_episodes.
+        Transitions go straight into the replay buffer without training, so no step runs the networks.
+
+        Args:
+            pairs (list[tuple[str, str]]): DNA and Protein Sequences
+
+        Returns:
+            Steps: Number of transitions added
+        """
+        # A separate environment keeps the sequence of self.env
+        env = Environment(window_size=self.env.window_size)
+        buffer = self.episodeBuffer
+        if buffer.states is None:
+            buffer.allocate((4 + 4 * env.window_size, env.codon_encoding.shape[1], 1))
+
+        steps = 0
+        for states, actions, rewards, next_states, dones in random_episodes(env, pairs, self.actions):
+            buffer.add_encoded(states, actions, rewards, next_states, dones)
+            self.env_counter.add(len(actions))
+            steps += len(actions)
+
+        return steps
+
+
     def train(self):
         """
-        Updates the weights of the main network using recorded previous steps
+        Updates the weights of the main network using recorded previous steps.
+        With the background learner the sampled batch is queued instead, see sync_learner.
+
+        Returns:
+            TD-Errors: TD-error of every sampled transition, also used to refresh its priority when replay is prioritized.
+                       None when the batch was queued.
+        """
+        if self.graph_replay:
+            return self.train_in_graph()
+
+        batch = self.episodeBuffer.sample(self.batchSize)
+
+        if self.learner is not None:
+            self.learner.submit(batch)
+            return None
+
+        return self.train_on_batch(batch)
+
+
+    def train_on_batch(self, batch):
+        """
+        Runs one gradient step of the main network on a batch sampled from the replay buffer
+
+        Returns:
+            TD-Errors: TD-error of every transition of the batch
+        """
+        if self.prioritized:
+            states, actions, rewards, next_states, dones, slots, weights = batch
+        else:
+            states, actions, rewards, next_states, dones = batch
+            weights = np.ones(len(actions), dtype=np.float32)
+
+        # Target Q-values, gradient step and the optional Polyak update in one call
+        _, td_errors = self.train_step(
+            states, actions, rewards, next_states, dones, weights,
+            tf.constant(self.train_tau, dtype=tf.float32), self.train_tau > 0,
+        )
+        self.clear_q_cache()
+
+        td_errors = td_errors.numpy()
+        if self.prioritized:
+            self.episodeBuffer.update_priorities(slots, td_errors)
+
+        self.train_counter.add()
+        return td_errors
+
+
+    def train_in_graph(self):
+        """
+        Runs updates_per_train gradient steps on batches sampled from the graph replay buffer,
+        with no batch copied between NumPy and TensorFlow
+
+        Returns:
+            TD-Errors: TD-error of every transition of the last batch
         """
-        states, actions, rewards, next_states, dones = self.episodeBuffer.sample(self.batchSize)
+        if self.batchSize > len(self.episodeBuffer):
+            raise ValueError("Sample larger than population")
+
+        self.episodeBuffer.flush()
+        _, td_errors = self.graph_train_step(
+            tf.constant(self.updates_per_train), tf.constant(self.train_tau, dtype=tf.float32), self.train_tau > 0,
+        )
+        self.clear_q_cache()
 
-        # Target_QN Predictions on next_state
+        self.train_counter.add(self.updates_per_train)
+        return td_errors.numpy()
+
+
+    def graph_train_step_fn(self, updates, tau, update_target : bool):
+        """
+        Several training steps on batches sampled in the graph, compiled by graph_train_step, see train_step_fn
+
+        Returns:
+            Loss: Weighted loss of the last batch
+            TD-Errors: TD-error of every transition of the last batch
+        """
+        loss = tf.constant(0.0)
+        td_errors = tf.zeros([self.batchSize])
+        weights = tf.ones([self.batchSize])
+
+        for _ in tf.range(updates):
+            states, actions, rewards, next_states, dones = self.episodeBuffer.sample_graph(self.batchSize)
+            loss, td_errors = self.train_step_fn(states, actions, rewards, next_states, dones, weights, tau, update_target)
+
+        return loss, td_errors
+
+
+    def sync_learner(self):
+        """
+        Waits until the background learner has trained on every queued batch, so the weights of the main network
+        are settled. Needed before reading or replacing the weights, e.g. for checkpoints.
+        """
+        if self.learner is not None:
+            self.learner.sync()
+
+
+    def throughput(self):
+        """
+        Returns the environment steps and gradient steps per second since the last reset_throughput
+        """
+        return {
+            "env_steps_per_sec": self.env_counter.per_second,
+            "train_steps_per_sec": self.train_counter.per_second,
+        }
+
+
+    def reset_throughput(self):
+        self.env_counter.reset()
+        self.train_counter.reset()
+
+
+    def train_step_fn(self, states, actions, rewards, next_states, dones, weights, tau, update_target : bool):
+        """
+        One training step, compiled by train_step. Evaluates the target network on the next states,
+        takes one gradient step of the main network and optionally moves the target network towards it.
+
+        Args:
+            states, actions, rewards, next_states, dones: Batch sampled from the replay buffer
+            weights: Importance sampling weight of every transition
+            tau: Polyak factor of the target update
+            update_target (bool): Whether the target network is updated, a separate graph is traced for each value
+
+        Returns:
+            Loss: Weighted loss of the batch
+            TD-Errors: TD-error of every transition of the batch
+        """
+        # Target_QN Predictions on next_state, Best Action and its Target Q-Value
         next_q_val_target = self.targetQN.model(next_states)
-        
-        # Get Best Action
         best_actions = tf.argmax(next_q_val_target, axis=1, output_type=tf.int32)
-
-        # Get Target Q-Value
         action_results = tf.gather(next_q_val_target, best_actions, axis=1, batch_dims=1)
-        target_q_values = rewards + (self.gamma * action_results * (1-dones))
+        target_q_values = tf.cast(rewards, tf.float32) + self.gamma * action_results * (1 - tf.cast(dones, tf.float32))
+
+        with tf.GradientTape() as tape:
+            q_values = self.mainQN.model(states)
+            prediction = tf.gather(q_values, tf.cast(actions, tf.int32), axis=1, batch_dims=1)
+            td_errors = target_q_values - prediction
+            loss = self.loss_fn(target_q_values, prediction, weights)
 
-        indices = tf.range(self.batchSize, dtype=tf.int32)
-        action_indices = tf.stack([indices, actions], axis = 1)
+        # Calculate and apply new gradients
+        gradients = tape.gradient(loss, self.mainQN.model.trainable_weights)
+        self.optimizer.apply_gradients(zip(gradients, self.mainQN.model.trainable_weights))
 
-        # Apply new gradients
-        self.update_mainQN(states, target_q_values, action_indices)
+        if update_target:
+            self.polyak_update_fn(tau)
+
+        return loss, td_errors
+
+
+    def polyak_update_fn(self, tau):
+        """
+        Moves every weight of the target network towards the main network, compiled by polyak_update
+        """
+        for target_weight, local_weight in zip(self.targetQN.model.weights, self.mainQN.model.weights):
+            target_weight.assign(tau * local_weight + (1 - tau) * target_weight)
 
 
     @tf.function
-    def update_mainQN(self, input, target_q, action_indices):
+    def update_mainQN(self, input, target_q, action_indices, weights):
         with tf.GradientTape() as tape:
             prediction = tf.gather_nd(self.mainQN.model(input), indices=action_indices)
-            loss = self.loss_fn(target_q, prediction)
+            td_errors = target_q - prediction
+            loss = self.loss_fn(target_q, prediction, weights)
     
         # Calculate New Gradients from loss
         gradients = tape.gradient(loss, self.mainQN.model.trainable_weights)
@@ -150,7 +407,7 @@ class Agent():
         # Apply new gradients to model's weights
         self.optimizer.apply_gradients(zip(gradients, self.mainQN.model.trainable_weights))
 
-        return loss
+        return loss, td_errors
 
 
     def soft_update_model(self, tau=0.01):
@@ -160,8 +417,9 @@ class Agent():
         Args:
             tau (float, optional): Discounting factor for updating the weights. Defaults to 0.01.
         """
-        for target_weight, local_weight in zip(self.targetQN.model.weights, self.mainQN.model.weights):
-            target_weight.assign(tau * local_weight + (1 - tau) * target_weight)
+        # The background learner reads the target network, let it finish first
+        self.sync_learner()
+        self.polyak_update(tf.constant(tau, dtype=tf.float32))
 
 
     def get_action(self, state : np.ndarray = None, test = False):
@@ -178,10 +436,72 @@ class Agent():
         if (random.uniform(0, 1) < self.epsilon and not test):
             return np.random.choice(self.actions)
         
+        elif test and self.student is not None:
+            return np.argmax(self.student.model(state))
+
+        elif test and self.inference_qn is not None:
+            return np.argmax(self.inference_qn.model(state))
+
         else:
-            q_vals = self.mainQN.model(state)
-            return np.argmax(q_vals)
-        
+            return np.argmax(self.q_values(state))
+
+
+    def get_actions(self, states : np.ndarray, test = False):
+        """
+        Get actions given a batch of states, same policy as get_action applied to every state
+
+        Args:
+            states (np.ndarray): Batch of input states
+
+        Returns:
+            Actions: Integer array with the action to be taken in every state
+        """
+        if test and self.student is not None:
+            return np.argmax(self.student.model(states), axis=1)
+
+        actions = np.argmax(self.q_values(states), axis=1)
+
+        if not test:
+            explore = np.random.uniform(0, 1, size=len(actions)) < self.epsilon
+            actions[explore] = np.random.choice(self.actions, size=np.count_nonzero(explore))
+
+        return actions
+
+    def q_values(self, states : np.ndarray):
+        """
+        Predicts the Q-values of a batch of states with the main network, looking them up in q_cache first if it is enabled
+
+        Args:
+            states (np.ndarray): Batch of input states
+
+        Returns:
+            Q-values: (batch, action_size) Q-values of every state
+        """
+        if self.q_cache is None:
+            return self.mainQN.model(states)
+
+        keys = self.q_cache.encode_states(states)
+        q_vals = [self.q_cache.get(key) for key in keys]
+
+        # One forward pass for every state that missed
+        missed = [k for k, q_val in enumerate(q_vals) if q_val is None]
+        if missed:
+            predictions = np.asarray(self.mainQN.model(np.asarray(states)[missed]))
+            for k, prediction in zip(missed, predictions):
+                q_vals[k] = prediction
+                self.q_cache.put(keys[k], prediction)
+
+        return np.stack(q_vals)
+
+
+    def clear_q_cache(self):
+        """
+        Drops the cached Q-values, needed whenever the weights of the main network change outside of train and load_weights
+        """
+        if self.q_cache is not None:
+            self.q_cache.clear()
+
+
     def test(self, save_dir:str, filename_1 : str = None, filename_2 : str = None, save=False, verbose=False):
         """
         Tests the agent on the current environment
@@ -218,6 +538,85 @@ class Agent():
         return total_score, total_reward
 
 
+    def test_batch(self, pairs : list, history = False, batch_size : int = 256):
+        """
+        Tests the agent on many DNA and Protein pairs, advancing up to batch_size episodes in lockstep
+        with one forward pass of the main network per step. Every episode plays out as in test.
+
+        Args:
+            pairs (list[tuple[str, str]]): DNA and Protein Sequences to test on
+            history (bool, optional): Boolean determining if the alignment history of every pair is returned. Defaults to False.
+            batch_size (int, optional): Maximum number of episodes played at once. Defaults to 256.
+
+        Returns:
+            Results: (total score, total reward) of every pair in order, followed by its alignment history if requested
+        """
+        results = [None] * len(pairs)
+        pending = iter(range(len(pairs)))
+
+        # Environments are kept between calls, every one of them plays one pair at a time
+        while len(self.test_envs) < min(batch_size, len(pairs)):
+            self.test_envs.append(Environment(window_size=self.env.window_size))
+
+        # [environment, pair index, state, total score, total reward] of every running episode
+        running = []
+        for env in self.test_envs[:min(batch_size, len(pairs))]:
+            index = next(pending)
+            env.set_seq(*pairs[index])
+            running.append([env, index, env.get_state(), 0, 0])
+
+        while running:
+            actions = self.get_actions(np.stack([episode[2] for episode in running]), test=True)
+
+            still_running = []
+            for episode, action in zip(running, actions):
+                env, index = episode[0], episode[1]
+                score, reward, done, next_state = env.step(action, history)
+                episode[2] = next_state
+                episode[3] += score
+                episode[4] += reward
+
+                if not done:
+                    still_running.append(episode)
+                    continue
+
+                results[index] = (episode[3], episode[4], env.alignment_history) if history else (episode[3], episode[4])
+
+                # Load the next pair into the finished environment
+                index = next(pending, None)
+                if index is not None:
+                    env.set_seq(*pairs[index])
+                    still_running.append([env, index, env.get_state(), 0, 0])
+
+            running = still_running
+
+        return results
+
+
+    def rollout(self, jit_compile = False):
+        """
+        Tests the agent on the current environment with the whole greedy episode run by one compiled
+        tf.function, see models_v2.rollout. Plays the same episode as test, without recording history.
+
+        Args:
+            jit_compile (bool, optional): Compile the episode with XLA. Defaults to False.
+
+        Returns:
+            Total Score: Total alignment score of the episode
+            Total Reward: Total reward received by the agent
+            Actions: Chosen action of every step
+        """
+        if jit_compile not in self.rollout_fns:
+            self.rollout_fns[jit_compile] = build_greedy_rollout(self.mainQN.model, self.env.window_size, jit_compile)
+
+        tables = self.env.get_rollout_tables()
+        actions = np.zeros(self.env.dna_len + self.env.protein_len, dtype=np.int32)
+
+        total_score, total_reward, steps, actions = self.rollout_fns[jit_compile](**tables, actions=actions)
+
+        return int(total_score), int(total_reward), actions.numpy()[:int(steps)]
+
+
     def find(self, save_dir:str, filename_1:str, filename_2:str, target_protein:str, protein_len: int = 10, save=False):
         """
         Finds a protein given the sequence
@@ -276,12 +675,35 @@ class Agent():
             path_1: Path to main network weights
             path_2: Path to target network weights
         """
+        self.sync_learner()
         self.mainQN.model.load_weights(path_1)
         self.targetQN.model.load_weights(path_2)
+        self.clear_q_cache()
+
+
+    def load_inference_weights(self, path):
+        """
+        Load main network weights exported by DDDQN.export_npz, test actions of get_action then run on NumPy
+
+        Args:
+            path: Path to the .npz file
+        """
+        self.inference_qn = NumpyDDDQN.load(path)
+
+
+    def load_student(self, path):
+        """
+        Load a student saved by StudentPolicy.save, test actions of get_action and get_actions then run on it
+
+        Args:
+            path: Path to the .npz file
+        """
+        self.student = StudentPolicy.load(path)
 
 
     def decay_epsilon(self):
         self.epsilon = max(self.epsilon * self.epsilon_decay, self.epsilon_min)
 
-    def loss_fn(self, y_true, y_pred):
-        return tf.reduce_mean(tf.square(y_true - y_pred))
+    def loss_fn(self, y_true, y_pred, weights=1.0):
+        # Importance sampling weights of prioritized replay scale every squared error
+        return tf.reduce_mean(weights * tf.square(y_true - y_pred))
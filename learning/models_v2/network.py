@@ -46,5 +46,37 @@ class DDDQN():
         q_vals = state_value + (advantage - advantage_mean)
 
         return Model(inputs=inputs, outputs=q_vals)
-    
 
+    def export_npz(self, path):
+        """
+        Saves the weights of the network to a single .npz file that NumpyDDDQN can load without TensorFlow
+
+        Args:
+            path: Path of the .npz file
+        """
+        np.savez(path, **self.numpy_weights())
+
+    def numpy_weights(self):
+        """
+        Returns the weights of the network by NumpyDDDQN layer name, as saved by export_npz
+        """
+        weights = {}
+
+        for k, layer in enumerate([layer for layer in self.model.layers if isinstance(layer, Conv2D)], 1):
+            weights[f"conv_{k}_kernel"], weights[f"conv_{k}_bias"] = layer.get_weights()
+
+        # Both heads start at the flatten layer, the advantage head ends in the mean Lambda
+        advantage_end = next(layer for layer in self.model.layers if isinstance(layer, Lambda)).input._keras_history[0]
+        value_end = next(layer for layer in self.model.layers
+                         if isinstance(layer, Dense) and layer.units == 1 and layer is not advantage_end)
+
+        for name, layer in (("advantage", advantage_end), ("value", value_end)):
+            head = []
+            while isinstance(layer, Dense):
+                head.append(layer)
+                layer = layer.input._keras_history[0]
+
+            for k, dense in enumerate(reversed(head), 1):
+                weights[f"{name}_{k}_kernel"], weights[f"{name}_{k}_bias"] = dense.get_weights()
+
+        return weights
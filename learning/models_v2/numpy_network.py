@@ -0,0 +1,83 @@
+import numpy as np
+
+
+class NumpyDDDQN():
+
+    def __init__(self, weights: dict) -> None:
+        """
+        Initialize an inference-only Dueling Double Deep Q-Network that runs on NumPy alone
+
+        Args:
+            weights (dict): Layer weights as written by DDDQN.export_npz
+        """
+        # Kernels are flattened to match the (row, column, channel) order of the im2col patches
+        self.convs = [(kernel.reshape(-1, kernel.shape[-1]), kernel.shape[:2], bias)
+                      for kernel, bias in self._layers(weights, "conv")]
+        self.value = self._layers(weights, "value")
+        self.advantage = self._layers(weights, "advantage")
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a network exported by DDDQN.export_npz
+
+        Args:
+            path: Path to the .npz file
+        """
+        with np.load(path) as weights:
+            return cls({name: weights[name].astype(np.float32) for name in weights.files})
+
+    @staticmethod
+    def _layers(weights, prefix):
+        layers = []
+        while f"{prefix}_{len(layers) + 1}_kernel" in weights:
+            k = len(layers) + 1
+            layers.append((weights[f"{prefix}_{k}_kernel"], weights[f"{prefix}_{k}_bias"]))
+
+        return layers
+
+    @staticmethod
+    def _conv2d(x, kernel, size, bias):
+        """
+        Same-padded, stride 1 convolution of a (batch, height, width, channels) input as one matrix product
+        """
+        kh, kw = size
+        _, height, width, _ = x.shape
+        padded = np.pad(x, ((0, 0), (kh // 2, kh // 2), (kw // 2, kw // 2), (0, 0)))
+
+        # im2col, every output pixel gets the kh * kw * channels values under the kernel
+        columns = np.concatenate([padded[:, i:i + height, j:j + width] for i in range(kh) for j in range(kw)], axis=-1)
+
+        columns = columns.reshape(-1, kernel.shape[0])
+
+        return (columns @ kernel + bias).reshape(x.shape[:3] + (kernel.shape[1],))
+
+    @staticmethod
+    def _dense(x, layers):
+        for k, (kernel, bias) in enumerate(layers):
+            x = x @ kernel + bias
+            if k < len(layers) - 1:
+                x = np.maximum(x, 0)
+
+        return x
+
+    def model(self, states):
+        """
+        Predicts the Q-values of a batch of states, same outputs as DDDQN.model
+
+        Args:
+            states: (batch, 4 + 4 * window_size, 23, 1) states
+
+        Returns:
+            NDArray: (batch, action_size) float32 Q-values
+        """
+        x = np.asarray(states, dtype=np.float32)
+
+        for kernel, size, bias in self.convs:
+            x = np.maximum(self._conv2d(x, kernel, size, bias), 0)
+
+        flatten = x.reshape(len(x), -1)
+        state_value = self._dense(flatten, self.value)
+        advantage = self._dense(flatten, self.advantage)
+
+        return state_value + (advantage - advantage.mean(axis=-1, keepdims=True))
@@ -0,0 +1,87 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+class QValueCache():
+
+    def __init__(self, maxsize: int):
+        """
+        Initialize a bounded least recently used cache of Q-values by state
+
+        Args:
+            maxsize (int): Maximum number of cached states
+        """
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        # A background learner clears the cache while actions are looked up
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def encode_states(states):
+        """
+        Encodes a batch of states as integers, every row of a state is one-hot so its column index is enough
+
+        Args:
+            states: (batch, rows, features, 1) states
+
+        Returns:
+            list: Integer key of every state, None for states that are not one-hot
+        """
+        states = np.asarray(states)
+        rows = states.reshape(len(states), -1, states.shape[2])
+        columns = rows.argmax(axis=2)
+
+        # Zero states (finished episodes) and anything else that is not one-hot is left uncached
+        one_hot = np.all((rows.sum(axis=2) == 1) & (rows.max(axis=2) == 1), axis=1)
+
+        return [int.from_bytes(row.astype(np.uint8).tobytes(), 'little') if valid else None for row, valid in zip(columns, one_hot)]
+
+    def get(self, key):
+        """
+        Returns the cached Q-values of a state key and marks them as recently used, None on a miss
+        """
+        with self.lock:
+            q_vals = self.entries.get(key) if key is not None else None
+            if q_vals is None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return q_vals
+
+    def put(self, key, q_vals):
+        """
+        Caches the Q-values of a state key, evicting the least recently used state when full
+        """
+        if key is None or self.maxsize <= 0:
+            return
+
+        with self.lock:
+            self.entries[key] = q_vals
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Drops every cached state, called whenever the weights of the cached network change. Counters are kept.
+        """
+        with self.lock:
+            self.entries.clear()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self.entries)
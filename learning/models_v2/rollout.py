@@ -0,0 +1,146 @@
+import tensorflow as tf
+from utils.constants import GAP_EXTENSION_PENALTY, GAP_OPEN_PENALTY, FRAMESHIFT_PENALTY
+from utils.scoring import residue_index
+
+GAP_PENALTY = GAP_OPEN_PENALTY + GAP_EXTENSION_PENALTY
+STOP_RESIDUE = residue_index('*')
+
+
+def _lex_greater(x, y):
+    """
+    Whether the 3 scores x come after y in list order, the comparison Python's max uses on lists
+    """
+    return (x[0] > y[0]) | ((x[0] == y[0]) & ((x[1] > y[1]) | ((x[1] == y[1]) & (x[2] > y[2]))))
+
+
+def build_greedy_rollout(model, window_size=1, jit_compile=False):
+    """
+    Builds a tf.function that plays a whole greedy test episode in one call, the same episode as Agent.test.
+    The loop, the state slicing, the forward pass and Environment.get_transition all run inside the graph.
+
+    Args:
+        model: Keras model of the main network, see DDDQN.model
+        window_size (int, optional): Window size of the Environment the tables come from. Defaults to 1.
+        jit_compile (bool, optional): Compile the rollout with XLA, which compiles again for every new pair of
+            sequence lengths. Defaults to False.
+
+    Returns:
+        rollout(dna_one_hot, protein_one_hot, dna_codons, dna_residues, protein_residues, score_table,
+                dna_len, protein_len, actions) -> (total score, total reward, steps, actions), where the first
+        eight arguments are Environment.get_rollout_tables and actions is an int32 buffer of at least
+        dna_len + protein_len steps, every step moves a pointer. The first steps entries of the returned
+        actions are the chosen actions.
+    """
+    window_rows = window_size * 3
+
+    @tf.function(reduce_retracing=True, jit_compile=jit_compile)
+    def rollout(dna_one_hot, protein_one_hot, dna_codons, dna_residues, protein_residues, score_table,
+                dna_len, protein_len, actions):
+        features = tf.shape(dna_one_hot)[1]
+
+        def transitions(d, p):
+            """
+            (score, reward, dna_move, protein_move) of every action from pointers d and p, see Environment.get_transition
+            """
+            prev_protein, curr_protein = protein_residues[p - 1], protein_residues[p]
+            prev_stop, curr_stop = prev_protein == STOP_RESIDUE, curr_protein == STOP_RESIDUE
+
+            # Codons at d - 4 ... d + 1, the past frames followed by the current frames
+            codons = tf.slice(dna_codons, [d - 4], [6])
+            translated = tf.slice(dna_residues, [d - 4], [6])
+            past_frames, curr_frames = translated[:3], translated[3:]
+
+            curr_scores = tf.gather(score_table[:, curr_protein], codons)
+            frame_scores = curr_scores[3:]
+            shift_scores = frame_scores - tf.constant([FRAMESHIFT_PENALTY, 0, FRAMESHIFT_PENALTY])
+            insertion_scores = tf.gather(score_table[:, prev_protein], codons[3:]) - GAP_PENALTY
+            deletion_scores = curr_scores[:3] - GAP_PENALTY
+
+            matches = tf.equal(curr_frames, curr_protein)
+            in_curr_frames = tf.reduce_any(matches)
+            in_past_frames = tf.reduce_any(tf.equal(past_frames, curr_protein))
+            prev_in_curr_frames = tf.reduce_any(tf.equal(curr_frames, prev_protein))
+
+            max_insertion = tf.reduce_max(insertion_scores)
+            max_deletion = tf.reduce_max(deletion_scores)
+            max_shift = tf.reduce_max(shift_scores)
+            cond = max_insertion <= max_deletion
+
+            def frame_outcome(score, valid, dna_move):
+                # Gap protein scores nothing and gets -2
+                return tf.stack([tf.where(curr_stop, 0, score), tf.where(curr_stop | ~valid, -2, 0), dna_move, 1])
+
+            def gap_outcome(skip, insertion, valid):
+                # Gaps next to a gap protein or a matching frame score nothing, get -2 and skip ahead
+                return tf.stack([
+                    tf.where(skip, 0, tf.where(cond & in_past_frames, max_insertion, max_deletion)),
+                    tf.where(skip | ~valid, -2, 1),
+                    tf.where(skip, 4, 2 + tf.argmax(deletion_scores, output_type=tf.int32) if insertion else 0),
+                    tf.where(skip, 0, 0 if insertion else 1),
+                ])
+
+            # Largest of the three score lists in list order, as max(scores, scores_1, scores_2)
+            best = shift_scores
+            best = tf.where(_lex_greater(insertion_scores, best), insertion_scores, best)
+            best = tf.where(_lex_greater(deletion_scores, best), deletion_scores, best)
+
+            mismatch_valid = (
+                (max_shift > max_insertion) & (max_shift > max_deletion)
+            ) | (
+                ~prev_in_curr_frames & ~prev_stop & ~in_past_frames & ~in_curr_frames & ~curr_stop
+            )
+
+            return tf.stack([
+                # MATCH
+                frame_outcome(frame_scores[1], matches[1], 3),
+                # FRAMESHIFT 1
+                frame_outcome(shift_scores[0], ~matches[1] & matches[0], 2),
+                # FRAMESHIFT 3
+                frame_outcome(shift_scores[2], ~matches[1] & ~matches[0] & matches[2], 4),
+                # INSERTION
+                gap_outcome(prev_stop | in_curr_frames, True, ~cond & prev_in_curr_frames),
+                # DELETION
+                gap_outcome(curr_stop | in_curr_frames, False, cond & in_past_frames),
+                # MISMATCH
+                tf.stack([
+                    tf.reduce_max(best),
+                    tf.where(mismatch_valid, 0, -2),
+                    2 + tf.argmax(shift_scores, output_type=tf.int32),
+                    1,
+                ]),
+            ])
+
+        def body(step, d, p, done, total_score, total_reward, actions):
+            state = tf.concat([
+                # Previous 3 Frames (3 Codons)
+                tf.slice(dna_one_hot, [d - 4, 0], [3, features]),
+                # Previous Protein
+                tf.slice(protein_one_hot, [p - 1, 0], [1, features]),
+                # Current Window Frames (N Codons)
+                tf.slice(dna_one_hot, [d - 1, 0], [window_rows, features]),
+                # Current Window Protein
+                tf.slice(protein_one_hot, [p, 0], [window_size, features]),
+            ], axis=0)
+
+            q_vals = model(state[tf.newaxis, ..., tf.newaxis])
+            action = tf.argmax(q_vals[0], output_type=tf.int32)
+
+            score, reward, dna_move, protein_move = tf.unstack(transitions(d, p)[action])
+            d, p = d + dna_move, p + protein_move
+
+            return (
+                step + 1, d, p, (d >= dna_len) | (p >= protein_len),
+                total_score + score, total_reward + reward,
+                tf.tensor_scatter_nd_update(actions, [[step]], [action]),
+            )
+
+        # Like Agent.test, at least one step is taken
+        step, _, _, _, total_score, total_reward, actions = tf.while_loop(
+            lambda step, d, p, done, *_: ~done,
+            body,
+            (tf.constant(0), tf.constant(4), tf.constant(1), tf.constant(False), tf.constant(0), tf.constant(0), actions),
+        )
+
+        return total_score, total_reward, step, actions
+
+    return rollout
@@ -0,0 +1,207 @@
+import numpy as np
+from keras import Model
+from keras.layers import Dense, Flatten, Input as K_Input
+from keras.optimizers import Adam
+from models_v2.environment import Environment
+from models_v2.experience_buffer import encode_states
+from models_v2.bulk_explore import random_episodes
+
+
+def build_student_model(input_shape, action_size: int, hidden=(512, 256)):
+    """
+    Keras model of the student, an MLP over the flattened one-hot state whose Q-values are fit to the teacher's
+    """
+    inputs = K_Input(shape=input_shape)
+    x = Flatten()(inputs)
+    for units in hidden:
+        x = Dense(units, activation='relu')(x)
+
+    return Model(inputs=inputs, outputs=Dense(action_size, activation='linear')(x))
+
+
+def quantize_int8(kernel):
+    """
+    Symmetric per-output-channel int8 quantization of a (..., outputs) kernel
+
+    Returns:
+        Values: int8 kernel
+        Scales: float32 scale of every output channel, kernel ~ values * scales
+    """
+    flat = kernel.reshape(-1, kernel.shape[-1])
+    scales = np.abs(flat).max(axis=0) / 127.0
+    scales[scales == 0] = 1.0
+
+    return np.clip(np.round(kernel / scales), -127, 127).astype(np.int8), scales.astype(np.float32)
+
+
+class StudentPolicy():
+
+    def __init__(self, weights: dict) -> None:
+        """
+        Initialize an inference-only student network that runs on NumPy alone. The first layer is an embedding
+        table looked up with the code of every one-hot row, see experience_buffer.encode_states, the layers after it
+        are dense. Quantized kernels are kept as int8 with a scale per output channel and expanded once here.
+
+        Args:
+            weights (dict): Layer weights as written by save
+        """
+        self.weights = weights
+
+        def kernel(name):
+            if f"{name}_scale" in weights:
+                return weights[name].astype(np.float32) * weights[f"{name}_scale"]
+            return weights[name].astype(np.float32)
+
+        # (rows, codes, units) table flattened so one gather looks up every row, code 0 is an all-zero row
+        embedding = kernel("embedding")
+        self.rows, self.codes = embedding.shape[:2]
+        self.embedding = embedding.reshape(self.rows * self.codes, -1)
+        self.offsets = np.arange(self.rows) * self.codes
+        self.embedding_bias = weights["embedding_bias"].astype(np.float32)
+
+        self.dense = []
+        while f"dense_{len(self.dense) + 1}_kernel" in weights:
+            k = len(self.dense) + 1
+            self.dense.append((kernel(f"dense_{k}_kernel"), weights[f"dense_{k}_bias"].astype(np.float32)))
+
+    @classmethod
+    def from_model(cls, model: Model):
+        """
+        Converts a Keras model built by build_student_model
+        """
+        dense = [layer for layer in model.layers if isinstance(layer, Dense)]
+        kernel, bias = dense[0].get_weights()
+
+        rows, features = model.input_shape[1], model.input_shape[2]
+        table = np.zeros((rows, features + 1, kernel.shape[1]), dtype=np.float32)
+        table[:, 1:] = kernel.reshape(rows, features, -1)
+
+        weights = {"embedding": table, "embedding_bias": bias}
+        for k, layer in enumerate(dense[1:], 1):
+            weights[f"dense_{k}_kernel"], weights[f"dense_{k}_bias"] = layer.get_weights()
+
+        return cls(weights)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a student saved by save
+
+        Args:
+            path: Path to the .npz file
+        """
+        with np.load(path) as weights:
+            return cls({name: weights[name] for name in weights.files})
+
+    def save(self, path):
+        np.savez(path, **self.weights)
+
+    @property
+    def quantized(self):
+        return "embedding_scale" in self.weights
+
+    def quantize(self):
+        """
+        Returns a copy with int8 kernels, post-training and weight-only. Biases stay float32.
+        """
+        weights = dict(self.weights)
+        for name in ["embedding"] + [f"dense_{k}_kernel" for k in range(1, len(self.dense) + 1)]:
+            if f"{name}_scale" not in weights:
+                weights[name], weights[f"{name}_scale"] = quantize_int8(weights[name].astype(np.float32))
+
+        return StudentPolicy(weights)
+
+    def model(self, states):
+        """
+        Predicts the Q-values of a batch of states
+
+        Args:
+            states: (batch, 4 + 4 * window_size, 23, 1) states of one-hot or all-zero rows
+
+        Returns:
+            NDArray: (batch, action_size) float32 Q-values
+        """
+        states = np.asarray(states)
+        rows = states.reshape(len(states), self.rows, -1)
+        codes = np.where(rows.any(axis=2), rows.argmax(axis=2) + 1, 0)
+        return self.model_codes(codes)
+
+    def model_codes(self, codes):
+        """
+        Predicts the Q-values of a batch of encoded states, see experience_buffer.encode_states
+        """
+        x = self.embedding[codes + self.offsets].sum(axis=1) + self.embedding_bias
+
+        for kernel, bias in self.dense:
+            x = np.maximum(x, 0) @ kernel + bias
+
+        return x
+
+
+def sample_states(agent, pairs: list):
+    """
+    States of real sequences to distill on, from one random-action episode and one greedy episode of the teacher per pair
+
+    Returns:
+        NDArray: (states, rows) distinct state codes
+    """
+    env = Environment(window_size=agent.env.window_size)
+    codes = [states for states, *_ in random_episodes(env, pairs, agent.actions)]
+
+    for dna, protein in pairs:
+        agent.env.set_seq(dna, protein)
+        _, _, actions = agent.rollout()
+
+        env.set_seq(dna, protein)
+        states = []
+        for action in actions:
+            states.append(env.get_state())
+            env.step(action)
+        codes.append(encode_states(np.array(states)))
+
+    return np.unique(np.concatenate(codes), axis=0)
+
+
+def distill(agent, pairs: list, hidden=(512, 256), epochs: int = 60, batch_size: int = 256,
+            threshold: float = 0.95, quantize: bool = True, holdout: float = 0.1):
+    """
+    Trains a student on the Q-values of the main network of the agent over states of the pairs
+
+    Args:
+        agent (Agent): Teacher
+        pairs (list[tuple[str, str]]): DNA and Protein Sequences the states are sampled from
+        hidden (tuple, optional): Units of the hidden layers. Defaults to (512, 256).
+        epochs (int, optional): Passes over the states. Defaults to 60.
+        batch_size (int, optional): States per gradient step. Defaults to 256.
+        threshold (float, optional): Lowest argmax agreement with the teacher on held-out states. Defaults to 0.95.
+        quantize (bool, optional): Quantize the kernels of the student to int8. Defaults to True.
+        holdout (float, optional): Fraction of states held out for the agreement. Defaults to 0.1.
+
+    Returns:
+        StudentPolicy: Student, quantized if requested
+        Agreement: Argmax agreement with the teacher on the held-out states
+    """
+    codes = np.random.permutation(sample_states(agent, pairs))
+
+    model = agent.mainQN.model
+    state_shape = tuple(model.input_shape[1:])
+    decoding = np.vstack([np.zeros((1, state_shape[1]), dtype=np.float32), np.eye(state_shape[1], dtype=np.float32)])
+    states = decoding[codes].reshape((len(codes),) + state_shape)
+
+    agent.sync_learner()
+    teacher_q = np.concatenate([model(states[k:k + 1024], training=False).numpy() for k in range(0, len(states), 1024)])
+
+    split = int(len(codes) * (1 - holdout))
+    student_model = build_student_model(state_shape, teacher_q.shape[1], hidden)
+    student_model.compile(optimizer=Adam(0.001), loss='mse')
+    student_model.fit(states[:split], teacher_q[:split], epochs=epochs, batch_size=batch_size, verbose=0)
+
+    student = StudentPolicy.from_model(student_model)
+    if quantize:
+        student = student.quantize()
+
+    agreement = float(np.mean(np.argmax(student.model_codes(codes[split:]), axis=1) == np.argmax(teacher_q[split:], axis=1)))
+    if agreement < threshold:
+        raise ValueError(f"Student agrees with the teacher on {agreement:.3f} of the held-out states, below {threshold}")
+
+    return student, agreement
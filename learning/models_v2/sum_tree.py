@@ -0,0 +1,67 @@
+import numpy as np
+
+
+class SumTree():
+
+    def __init__(self, capacity: int):
+        """
+        Initialize an array-based binary tree where every node holds the sum of its children,
+        used to sample leaves in proportion to their priority
+
+        Args:
+            capacity (int): Number of leaves
+        """
+        self.capacity = capacity
+
+        # Complete tree over a power of two leaves, node k has children 2k + 1 and 2k + 2
+        self.leaves = 1 << max(capacity - 1, 0).bit_length()
+        self.depth = self.leaves.bit_length() - 1
+        self.nodes = np.zeros(2 * self.leaves - 1, dtype=np.float64)
+
+    @property
+    def total(self):
+        return self.nodes[0]
+
+    def get(self, indices):
+        """
+        Returns the priorities of the given leaves
+        """
+        return self.nodes[np.asarray(indices) + self.leaves - 1]
+
+    def update(self, indices, priorities):
+        """
+        Sets the priorities of the given leaves and the sums above them, O(log n) per leaf
+
+        Args:
+            indices: Leaf indices
+            priorities: New priority of every leaf
+        """
+        nodes = np.atleast_1d(np.asarray(indices, dtype=np.int64)) + self.leaves - 1
+        self.nodes[nodes] = priorities
+
+        # Recompute one level of parents at a time, shared parents only once
+        for _ in range(self.depth):
+            nodes = np.unique((nodes - 1) // 2)
+            self.nodes[nodes] = self.nodes[2 * nodes + 1] + self.nodes[2 * nodes + 2]
+
+    def find(self, values):
+        """
+        Finds the leaves whose cumulative priority ranges contain the given values, O(log n) per value
+
+        Args:
+            values: Values in [0, total)
+
+        Returns:
+            NDArray: Leaf index of every value
+        """
+        values = np.array(values, dtype=np.float64, ndmin=1)
+        nodes = np.zeros(len(values), dtype=np.int64)
+
+        for _ in range(self.depth):
+            left = 2 * nodes + 1
+            go_right = values >= self.nodes[left]
+            values = np.where(go_right, values - self.nodes[left], values)
+            nodes = np.where(go_right, left + 1, left)
+
+        # Rounding can walk past the last leaf with a priority
+        return np.minimum(nodes - (self.leaves - 1), self.capacity - 1)
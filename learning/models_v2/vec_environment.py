@@ -0,0 +1,117 @@
+import random
+import numpy as np
+from models_v2.environment import Environment
+
+class VecEnvironment:
+    def __init__(self, pairs: list, num_envs: int, window_size=1, shuffle=True):
+        """
+        Initialize a batch of Dna to Protein Alignment Environments that step together.
+        Every slot aligns one DNA and Protein pair and moves on to the next pair once it is done.
+
+        Args:
+            pairs (list[tuple[str, str]]): DNA and Protein Sequences handed out to the slots
+            num_envs (int): Number of slots
+            window_size (int, optional): Window size of every Environment. Defaults to 1.
+            shuffle (bool, optional): Hand out the pairs in a new random order on every pass. Defaults to True.
+        """
+        if len(pairs) == 0:
+            raise ValueError("VecEnvironment needs at least one DNA and Protein pair")
+
+        self.pairs = pairs
+        self.num_envs = num_envs
+        self.shuffle = shuffle
+        self.envs = [Environment(window_size=window_size) for _ in range(num_envs)]
+
+        # Pairs are handed out in passes over self.pairs
+        self.order = []
+
+        # Running totals of the current episode of every slot
+        self.scores = np.zeros(num_envs, dtype=np.int64)
+        self.rewards = np.zeros(num_envs, dtype=np.int64)
+        self.steps = np.zeros(num_envs, dtype=np.int64)
+
+        # (score, reward, steps) of every finished episode, see pop_finished
+        self.finished = []
+
+        self.reset()
+
+    def reset(self):
+        """
+        Loads a new pair into every slot
+        """
+        for k in range(self.num_envs):
+            self.load_pair(k)
+
+    def load_pair(self, k: int):
+        """
+        Loads the next DNA and Protein pair into slot k and resets its totals
+        """
+        if not self.order:
+            self.order = list(range(len(self.pairs)))
+            if self.shuffle:
+                random.shuffle(self.order)
+            self.order.reverse()
+
+        dna, protein = self.pairs[self.order.pop()]
+        self.envs[k].set_seq(dna, protein)
+
+        self.scores[k] = 0
+        self.rewards[k] = 0
+        self.steps[k] = 0
+
+    def get_states(self):
+        """
+        Returns the current state of every slot
+
+        Returns:
+            NDArray: (num_envs, 4 + 4 * window_size, 23, 1) float32 states
+        """
+        return np.stack([env.get_state() for env in self.envs])
+
+    def step(self, actions, record=False):
+        """
+        Performs one action in every slot, slots that finish are loaded with the next pair
+
+        Args:
+            actions (NDArray): Chosen action of every slot
+            record (bool, optional): Record the alignment history of every slot. Defaults to False.
+
+        Returns:
+            scores: (num_envs,) alignment score of every action
+            rewards: (num_envs,) reward of every action
+            dones: (num_envs,) whether the action finished the episode of the slot
+            next_states: (num_envs, 4 + 4 * window_size, 23, 1) next state of every slot, as returned
+                by Environment.step. Use get_states for the states after finished slots are reloaded.
+        """
+        scores = np.zeros(self.num_envs, dtype=np.int64)
+        rewards = np.zeros(self.num_envs, dtype=np.int64)
+        dones = np.zeros(self.num_envs, dtype=bool)
+        next_states = None
+
+        for k, (env, action) in enumerate(zip(self.envs, actions)):
+            score, reward, done, next_state = env.step(int(action), record)
+
+            if next_states is None:
+                next_states = np.zeros((self.num_envs,) + next_state.shape, dtype=np.float32)
+
+            scores[k], rewards[k], dones[k], next_states[k] = score, reward, done, next_state
+
+            self.scores[k] += score
+            self.rewards[k] += reward
+            self.steps[k] += 1
+
+            if done:
+                self.finished.append((int(self.scores[k]), int(self.rewards[k]), int(self.steps[k])))
+                self.load_pair(k)
+
+        return scores, rewards, dones, next_states
+
+    def pop_finished(self):
+        """
+        Returns and clears the (score, reward, steps) of the episodes finished since the last call
+        """
+        finished, self.finished = self.finished, []
+        return finished
+
+    def __len__(self):
+        return self.num_envs
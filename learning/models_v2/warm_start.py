@@ -0,0 +1,198 @@
+import hashlib
+import os
+import numpy as np
+import tensorflow as tf
+from keras.optimizers import Adam
+from utils.aligner import ThreeFrameAligner
+from models_v2.experience_buffer import encode_states
+
+
+def alignment_moves(alignment):
+    """
+    Pointer moves of an aligner alignment, (dna_move, protein_move) per environment step with gap runs split into single steps
+
+    Args:
+        alignment (list[tuple[str, str]]): DNA-Protein pairings returned by ThreeFrameAligner.align
+    """
+    moves = []
+    for dna_part, protein_part in alignment:
+        if dna_part == "---":
+            moves.extend([(0, 1)] * len(protein_part))
+        elif protein_part == "-":
+            moves.extend([(3, 0)] * (len(dna_part) // 3))
+        else:
+            moves.append((len(dna_part), 1))
+
+    return moves
+
+
+def label_pair(env, aligner, dna: str, protein: str):
+    """
+    Follows the optimal alignment of a pair through the environment and labels every state on the way.
+    The label is the action whose move lands on the alignment path the fewest moves ahead, so gap runs the
+    environment skips over in one step still count, the one with the highest reward when several do.
+    Stops where every action leaves the path.
+
+    Args:
+        env (Environment): Environment, its sequences are replaced
+        aligner (ThreeFrameAligner): Aligner giving the optimal alignment
+        dna (str): DNA Sequence
+        protein (str): Protein Sequence
+
+    Returns:
+        States: (steps, rows) state codes, see experience_buffer.encode_states
+        Actions: Optimal action of every state
+        Coverage: Fraction of the alignment path followed before leaving it or finishing the episode
+    """
+    _, _, alignment = aligner.align(dna, protein)
+    moves = alignment_moves(alignment)
+
+    # A semi-global alignment can leave a prefix unaligned, skipped with gaps
+    dna_prefix = max(len(dna) - sum(move[0] for move in moves), 0)
+    protein_prefix = max(len(protein) - sum(move[1] for move in moves), 0)
+    moves = [(3, 0)] * (dna_prefix // 3) + [(0, 1)] * protein_prefix + moves
+
+    env.set_seq(dna, protein)
+
+    # Pointers after every move, starting from those of reset
+    path = {}
+    pointers = (env.dna_pointer, env.protein_pointer)
+    for k, (dna_move, protein_move) in enumerate(moves, 1):
+        pointers = (pointers[0] + dna_move, pointers[1] + protein_move)
+        path.setdefault(pointers, k)
+
+    states, actions = [], []
+    position = 0
+    while not env.isDone():
+        candidates = []
+        for action in range(6):
+            _, reward, dna_move, protein_move = env.get_transition(action)
+            ahead = path.get((env.dna_pointer + dna_move, env.protein_pointer + protein_move), 0)
+            if ahead > position:
+                candidates.append((-ahead, reward, -action))
+
+        if not candidates:
+            break
+
+        ahead, _, action = max(candidates)
+        states.append(env.get_state())
+        actions.append(-action)
+        env.step(-action)
+        position = -ahead
+
+    coverage = 1.0 if env.isDone() else position / max(len(moves), 1)
+    codes = encode_states(np.array(states)) if states else np.zeros((0, env.get_state().shape[0]), dtype=np.uint8)
+    return codes, np.array(actions, dtype=np.uint8), coverage
+
+
+def pairs_key(pairs: list, window_size: int):
+    """
+    Hash of the pairs and window size a label file was made from
+    """
+    digest = hashlib.sha1(str(window_size).encode())
+    for dna, protein in pairs:
+        digest.update(f"{dna}\n{protein}\n".encode())
+
+    return digest.hexdigest()
+
+
+def load_or_label(path: str, env, pairs: list):
+    """
+    Loads the labels of the pairs from path, labelling them with ThreeFrameAligner and saving them there first
+    when the file is missing or was made from other pairs
+
+    Args:
+        path (str): .npz label file
+        env (Environment): Environment used for labelling, its sequences are replaced
+        pairs (list[tuple[str, str]]): DNA and Protein Sequences
+
+    Returns:
+        States: (labels, rows) uint8 state codes
+        Actions: (labels,) uint8 optimal actions
+    """
+    key = pairs_key(pairs, env.window_size)
+
+    if os.path.isfile(path):
+        with np.load(path) as labels:
+            if str(labels["key"]) == key:
+                return labels["states"], labels["actions"]
+
+    aligner = ThreeFrameAligner(backtrace=ThreeFrameAligner.Backtrace.SEMI_GLOBAL)
+    states, actions = [], []
+    for dna, protein in pairs:
+        pair_states, pair_actions, _ = label_pair(env, aligner, dna, protein)
+        states.append(pair_states)
+        actions.append(pair_actions)
+
+    states, actions = np.concatenate(states), np.concatenate(actions)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    np.savez_compressed(path, states=states, actions=actions, key=key)
+    return states, actions
+
+
+def pretrain(agent, states, actions, epochs: int = 5, batch_size: int = 256, loss: str = "margin",
+             margin: float = 0.8, learning_rate: float = 0.001):
+    """
+    Trains the main network of the agent to pick the labelled actions, then copies it into the target network
+
+    Args:
+        agent (Agent): Agent to pretrain
+        states: (labels, rows) uint8 state codes
+        actions: (labels,) optimal actions
+        epochs (int, optional): Passes over the labels. Defaults to 5.
+        batch_size (int, optional): Labels per gradient step. Defaults to 256.
+        loss (str, optional): "margin", the large margin loss of DQfD that keeps the labelled action margin above the
+                              others, or "cross_entropy" over the Q-values. Defaults to "margin".
+        margin (float, optional): Margin of the margin loss. Defaults to 0.8.
+        learning_rate (float, optional): Learning rate of the pretraining optimizer. Defaults to 0.001.
+
+    Returns:
+        History: (loss, accuracy) of every epoch, accuracy is how often the argmax is the labelled action
+    """
+    if loss not in ("margin", "cross_entropy"):
+        raise ValueError(f"Unknown pretraining loss {loss}")
+
+    model = agent.mainQN.model
+    state_shape = tuple(model.input_shape[1:])
+    num_actions = model.output_shape[-1]
+    decoding = np.vstack([np.zeros((1, state_shape[1]), dtype=np.float32), np.eye(state_shape[1], dtype=np.float32)])
+
+    # Separate from the optimizer of the agent, whose moments belong to the TD loss
+    optimizer = Adam(learning_rate)
+
+    @tf.function
+    def train_step(batch_states, batch_actions):
+        with tf.GradientTape() as tape:
+            q_values = model(batch_states, training=True)
+            if loss == "margin":
+                expert_q = tf.gather(q_values, batch_actions, axis=1, batch_dims=1)
+                margins = margin * (1.0 - tf.one_hot(batch_actions, num_actions))
+                batch_loss = tf.reduce_mean(tf.reduce_max(q_values + margins, axis=1) - expert_q)
+            else:
+                batch_loss = tf.reduce_mean(tf.nn.sparse_softmax_cross_entropy_with_logits(batch_actions, q_values))
+
+        gradients = tape.gradient(batch_loss, model.trainable_weights)
+        optimizer.apply_gradients(zip(gradients, model.trainable_weights))
+
+        correct = tf.reduce_sum(tf.cast(tf.argmax(q_values, axis=1, output_type=tf.int32) == batch_actions, tf.float32))
+        return batch_loss, correct
+
+    agent.sync_learner()
+    history = []
+    for _ in range(epochs):
+        total_loss, total_correct = 0.0, 0.0
+        order = np.random.permutation(len(actions))
+
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            batch_states = decoding[states[batch]].reshape((len(batch),) + state_shape)
+            batch_loss, correct = train_step(batch_states, actions[batch].astype(np.int32))
+            total_loss += float(batch_loss) * len(batch)
+            total_correct += float(correct)
+
+        history.append((total_loss / len(order), total_correct / len(order)))
+
+    agent.targetQN.model.set_weights(model.get_weights())
+    agent.clear_q_cache()
+    return history
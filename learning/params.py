@@ -13,6 +13,31 @@ PARAMS = {
     'window_size' : 1,              # Window Size for Input
     'input_shape' : (8, 23, 1),    # Input Shape is (4 + (w*4), 23, 1) where w is the window size
     'lr' : 0.001,
+    'prioritized_replay' : False,   # Sample replay by TD-error from a sum-tree instead of uniformly
+    'per_alpha' : 0.6,              # Prioritization exponent, 0 is uniform
+    'per_beta' : 0.4,               # Starting importance sampling exponent, annealed to 1
+    'per_beta_increment' : 0.001,   # Increase of the importance sampling exponent per sample
+    'async_learner' : False,        # Run gradient steps on a background thread while the agent keeps playing
+    'learner_queue_size' : 4,       # Sampled batches waiting for the background learner at most
+    'checkpoints_kept' : 3,         # Newest training checkpoints kept by train_v2.py
+    'persist_replay' : True,        # Save the replay buffer with every checkpoint and reload it on resume
+    'num_actors' : 0,               # Actor processes for Ape-X style training in train_v2.py, 0 trains serially
+    'actor_envs' : 8,               # Environments every actor steps in lockstep
+    'actor_send_steps' : 32,        # Steps an actor takes before sending its transitions to the learner
+    'weight_sync_freq' : 50,        # Learner updates between weight broadcasts to the actors
+    'q_cache_size' : 0,             # States whose Q-values Agent.get_action keeps, 0 disables the cache
+    'jit_compile' : False,          # Compile the training step with XLA
+    'train_tau' : 0.0,              # Polyak factor of a target update after every gradient step, 0 leaves it to soft_update_model
+    'graph_replay' : False,         # Keep the replay buffer in tf.Variables and sample it inside the training step
+    'updates_per_train' : 1,        # Gradient steps per Agent.train call with graph_replay
+    'warm_start' : False,           # Pretrain the main network on ThreeFrameAligner alignments of data/ before RL in train_v2.py
+    'warm_start_epochs' : 3,        # Passes over the aligner labels
+    'warm_start_loss' : 'margin',   # 'margin' (DQfD large margin) or 'cross_entropy'
+    'warm_start_epsilon' : 0.1,     # Starting epsilon after pretraining
+    'student_hidden' : [512, 256],  # Hidden units of the distilled student policy, see distill_student.py
+    'student_epochs' : 60,          # Passes over the sampled states when distilling
+    'student_agreement' : 0.95,     # Lowest argmax agreement with the main network the student must reach
+    'student_quantize' : True,      # Store the student with int8 kernels
     'actions' : [
         Action.MATCH.value, 
         Action.FRAMESHIFT_1.value, 
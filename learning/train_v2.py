@@ -2,8 +2,11 @@ from pathlib import Path
 import os
 import time
 from params import PARAMS
-from models.network import DDDQN
+from models_v2.network import DDDQN
 from models_v2.main_agent import Agent
+from models_v2.apex import ApeXTrainer
+from models_v2.checkpoint import CheckpointManager
+from models_v2.warm_start import load_or_label, pretrain
 from models_v2.environment import Environment
 
 def save_params(episode, epsilon):
@@ -56,14 +59,35 @@ TargetQN = DDDQN(learning_rate, len(actions), input_shape)
 environment = Environment(window_size=PARAMS['window_size'])
 agent = Agent(MainQN, TargetQN, environment, PARAMS, actions)
 
+# Copies of the networks that export every checkpoint as .h5 weights for the test scripts, on the writer thread
+ExportMainQN = DDDQN(learning_rate, len(actions), input_shape)
+ExportTargetQN = DDDQN(learning_rate, len(actions), input_shape)
+
+def export_checkpoint(snapshot):
+    ExportMainQN.model.set_weights(snapshot["main"])
+    ExportMainQN.model.save_weights(checkpoint_paths[0])
+    ExportTargetQN.model.set_weights(snapshot["target"])
+    ExportTargetQN.model.save_weights(checkpoint_paths[1])
+    save_params(snapshot["episode"], snapshot["epsilon"])
+
+checkpoints = CheckpointManager("./saved_weights/checkpoints", keep=PARAMS['checkpoints_kept'], export=export_checkpoint, replay=PARAMS['persist_replay'])
+
 # <============================================= Training Loop =============================================>
 
 # Check if there are saved weights, load weights into networks
+latest_checkpoint = checkpoints.latest()
 resume = (os.path.isfile(checkpoint_paths[0]) and os.path.isfile(checkpoint_paths[1]))
 prev_episodes = 0
 
-# Resume Training
-if resume:
+# Resume Training from the newest checkpoint
+if latest_checkpoint is not None:
+    print(f"\n\nResuming Training from {latest_checkpoint['file']}...\n")
+    checkpoints.restore(agent, latest_checkpoint)
+    prev_episodes = latest_checkpoint['episode']
+    print(f"Restored {len(agent.episodeBuffer)} Replay Transitions\n")
+
+# Resume Training from weights saved before checkpoints
+elif resume:
     print("\n\nResuming Training...\n")
     file_1 = open("./saved_weights/params.txt", "r")
     file_2 = open("./saved_weights/training_results.txt", "r")
@@ -78,21 +102,59 @@ if resume:
     file_2.close()
 
 
-# Let Agent Explore (Do random actions)
-else:
+# Let Agent Explore (Do random actions), actors fill the replay buffer themselves
+elif PARAMS['num_actors'] == 0:
     print("\n\nStarting Explore Step...\n")
-    for i in range(len(dna_list)):
-        print(f"Run {i + 1}")
-        print(f"Loaded DNA File: {dna_filenames[i]}")
-        print(f"Loaded Protein File: {protein_filenames[i]}\n")
-        environment.set_seq(dna_list[i], protein_list[i])
-        agent.explore(reps=1)
+    start_time = time.time()
+    explore_steps = agent.explore_pairs(list(zip(dna_list, protein_list)))
+    print(f"Explored {len(dna_list)} Files, Steps Taken: {explore_steps}, Time Taken: {time.time() - start_time}\n")
+
+# Pretrain on the optimal alignments of the matching DNA and Protein files, labels are cached next to the weights
+if PARAMS['warm_start'] and latest_checkpoint is None and not resume:
+    print("\n\nStarting Warm Start...\n")
+    start_time = time.time()
+    warm_start_pairs = []
+    for fn in dna_filenames:
+        protein_fn = fn.replace("DNA", "AA", 1)
+        if os.path.isfile(f"{protein_dir}/{protein_fn}"):
+            with open(f"{dna_dir}/{fn}", 'r') as dna_file, open(f"{protein_dir}/{protein_fn}", 'r') as protein_file:
+                warm_start_pairs.append((dna_file.read().strip(), protein_file.read().strip()))
+
+    label_states, label_actions = load_or_label("./saved_weights/warm_start_labels.npz", Environment(window_size=PARAMS['window_size']), warm_start_pairs)
+    history = pretrain(agent, label_states, label_actions, epochs=PARAMS['warm_start_epochs'], batch_size=256, loss=PARAMS['warm_start_loss'])
+    agent.epsilon = PARAMS['warm_start_epsilon']
+
+    for epoch, (loss, accuracy) in enumerate(history, 1):
+        print(f"Epoch: {epoch}, Loss: {loss}, Accuracy: {accuracy}")
+    print(f"Labels: {len(label_actions)}, Time Taken: {time.time() - start_time}\n")
+
+# Actor-Learner Training, actors play with their own epsilon while this process trains
+if PARAMS['num_actors'] > 0:
+    print(f"\n\nStarting {PARAMS['num_actors']} Actors...\n")
+    trainer = ApeXTrainer(agent, list(zip(dna_list, protein_list)), PARAMS)
+    episodes = 1
+
+    for actor_id, curr_epsilon, score, reward, steps, duration in trainer.run(PARAMS['max_ep']):
+        print(f"Episode: {episodes + prev_episodes}, Actor: {actor_id}, Epsilon: {curr_epsilon}\n\tScore: {score}, Reward: {reward}, Time Taken: {duration}, Steps Taken: {steps}, Updates: {trainer.updates} \n")
+
+        # Update Target Q-Network every 20 Episodes
+        if(episodes % 20 == 0):
+            agent.soft_update_model(PARAMS['tau'])
+
+        # Checkpoint every 10 Episodes
+        if(episodes % 10 == 0):
+            checkpoints.save(agent, episodes + prev_episodes)
+
+        # Record results of agent
+        record_results((episodes + prev_episodes), score, reward, duration, steps, curr_epsilon)
+
+        episodes += 1
 
 episodes = 1
 i = 0
 environment.set_seq(dna_list[i], protein_list[i])
 
-while episodes <= PARAMS['max_ep']:
+while episodes <= PARAMS['max_ep'] and PARAMS['num_actors'] == 0:
         
     start = time.time()
     curr_epsilon = agent.epsilon
@@ -115,14 +177,14 @@ while episodes <= PARAMS['max_ep']:
             print(f"Loaded Protein File: {protein_filenames[i]}\n")
             environment.set_seq(dna_list[i], protein_list[i])
 
-    # Save Weights every 10 Episodes
+    # Checkpoint every 10 Episodes
     if(episodes > 0 and episodes % 10 == 0):
-        agent.mainQN.model.save_weights(checkpoint_paths[0])
-        agent.targetQN.model.save_weights(checkpoint_paths[1])
-        save_params(episodes, agent.epsilon)
+        checkpoints.save(agent, episodes + prev_episodes)
 
     # Record results of agent
     record_results((episodes + prev_episodes), score, reward, duration, steps, curr_epsilon)
 
     episodes += 1
 
+# Wait for the last checkpoints to be written
+checkpoints.close()
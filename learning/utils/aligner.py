@@ -1,7 +1,11 @@
+from collections import deque
 from enum import Enum
+from itertools import chain
 import blosum as bl
-import psutil
+import numpy as np
 from utils.constants import Action, CODON_TABLE, FRAMESHIFT_PENALTY, GAP_OPEN_PENALTY, GAP_EXTENSION_PENALTY, NEG_INF
+from utils.profiling import MemorySampler
+from utils.scoring import INVALID_CODON, NUM_CODONS, build_score_table, encode_dna, encode_protein, iter_encode_dna
 
 class ThreeFrameAligner():
 
@@ -9,22 +13,36 @@ class ThreeFrameAligner():
         GLOBAL = "global"
         SEMI_GLOBAL = "semi-global"
 
+    class Engine(Enum):
+        PYTHON = "python"
+        NUMPY = "numpy"
+
+    # Rows of T recomputed at once by the linear-space traceback
+    LINEAR_SPACE_BLOCK = 1024
+
     def __init__(self, 
                  gep=GAP_EXTENSION_PENALTY, 
                  gop=GAP_OPEN_PENALTY,
                  frameshift=FRAMESHIFT_PENALTY, 
                  table=CODON_TABLE,
                  substition=None,
-                 backtrace: Backtrace = Backtrace.GLOBAL):
-        self.process = psutil.Process()
-        self.init_mem = self.process.memory_info().rss
+                 backtrace: Backtrace = Backtrace.GLOBAL,
+                 engine: Engine = Engine.NUMPY,
+                 packed_traceback: bool = False,
+                 profile_memory: bool = False):
+        # Memory is only sampled when profiling, see MemorySampler
+        self.profile_memory = profile_memory
         self.ave_mem_usage = 0
+        self.peak_mem_usage = 0
         self.gep = gep
         self.gop = gop
         self.frameshift = frameshift
         self.table = table
         self.substitution = substition or bl.BLOSUM(62)
+        self.score_table = build_score_table(self.substitution, self.table)
         self.backtrace = backtrace
+        self.engine = engine
+        self.packed_traceback = packed_traceback
 
     def _translate_codon(self, codon):
         return self.table.get(codon, 'FAIL')
@@ -45,11 +63,11 @@ class ThreeFrameAligner():
         j = M
 
         # Set pointer to correct location
-        if Action(T[i][j]) is Action.MATCH:
+        if Action(T[i, j]) is Action.MATCH:
             i -= 1
 
         while i > 0 and j > 0:
-            action = Action(T[i][j])
+            action = Action(T[i, j])
             if action is Action.MATCH:
                 if self._translate_codon(dna[i-1:i+2]) != protein[j-1]:
                     action = Action.MISMATCH
@@ -66,13 +84,13 @@ class ThreeFrameAligner():
                 j -= 1
             if action is Action.INSERT:
                 sub_prot = ""
-                while Action(T[i][j]) is Action.INSERT:
+                while Action(T[i, j]) is Action.INSERT:
                     sub_prot = protein[j-1] + sub_prot
                     j -= 1
                 sequence.append(("---", sub_prot))
             if action is Action.DELETE:
                 sub_dna = ""
-                while Action(T[i][j]) is Action.DELETE:
+                while Action(T[i, j]) is Action.DELETE:
                     sub_dna = dna[i-1:i+2] + sub_dna
                     i -= 3
                 sequence.append((sub_dna, "-"))
@@ -80,26 +98,427 @@ class ThreeFrameAligner():
 
         return actions[::-1], sequence[::-1]
 
-    def align(self, dna_input, protein_input, debug=False):
+    def _score_profile(self, protein):
+        """
+        Precomputes the substitution scores used by the NumPy engine
+
+        Parameters:
+            protein: str - protein string
+
+        Returns:
+            profile: np.ndarray - scores of every codon index against every residue, indexed by j
+        """
+        # Column 0 is never scored, it only keeps j aligned with the matrices
+        profile = np.full((NUM_CODONS, len(protein) + 1), NEG_INF, dtype=np.int32)
+        profile[:, 1:] = self.score_table[:, encode_protein(protein)]
+
+        # Fractional penalties need a floating point fill
+        if any(penalty != int(penalty) for penalty in (self.gep, self.gop, self.frameshift)):
+            profile = profile.astype(np.float64)
+
+        return profile
+
+    def _fill_row(self, I, D, C, T, C_4, C_3, C_2, D_3, score):
+        """
+        Fills row i >= 4 of the I, D, C and T matrices in place
+
+        Parameters:
+            I, D, C, T: np.ndarray - row i of each matrix, column 0 already initialized
+            C_4, C_3, C_2: np.ndarray - rows i-4, i-3 and i-2 of C
+            D_3: np.ndarray - row i-3 of D
+            score: np.ndarray - substitution scores of codon i against every protein residue
+        """
+        # An empty protein leaves every row at its initial values
+        if len(I) == 1:
+            return
+
+        gap = self.gop + self.gep
+        D[1:] = np.maximum(D_3[1:] - self.gep, C_3[1:] - gap)
+
+        # Candidates are compared in the same order as the Python engine so that ties pick the same action
+        best = C_4[:-1] + score[1:] - self.frameshift
+        T[1:] = Action.FRAMESHIFT_1.value
+        for candidate, action in (
+            (C_3[:-1] + score[1:], Action.MATCH),
+            (C_2[:-1] + score[1:] - self.frameshift, Action.FRAMESHIFT_3),
+            (D[1:], Action.DELETE),
+        ):
+            better = candidate > best
+            best = np.where(better, candidate, best)
+            T[1:][better] = action.value
+
+        # I[j] = max(I[j-1] - gep, C[j-1] - gop - gep) where C[j-1] = max(best[j-1], I[j-1]).
+        # Offsetting by step * j turns the recurrence into a prefix maximum.
+        step = self.gep + min(self.gop, 0)
+        ramp = step * np.arange(1, len(I))
+        opened = np.empty(len(I) - 1, dtype=np.float64 if I.dtype.kind == 'f' else np.int64)
+        opened[0] = max(I[0] - self.gep, C[0] - gap)
+        opened[1:] = best[:-1] - gap
+        opened += ramp
+        I[1:] = np.maximum.accumulate(opened) - ramp
+
+        better = I[1:] > best
+        C[1:] = np.where(better, I[1:], best)
+        T[1:][better] = Action.INSERT.value
+
+    def _fill_insert_row(self, I, C):
+        """
+        Fills row i of the I matrix in place for a row whose C values are already final
+        """
+        if len(I) == 1:
+            return
+
+        ramp = self.gep * np.arange(1, len(I))
+        opened = C[:-1] - self.gop - self.gep + ramp
+        opened[0] = max(opened[0], I[0])
+        I[1:] = np.maximum.accumulate(opened) - ramp
+
+    def _fill_rows(self, codons, profile, M=None, start=0, window=(), previous=INVALID_CODON):
+        """
+        Fills the I, D, C and T matrices of the NumPy engine one DNA row at a time.
+        Only rows i-4 to i of C and D are kept, so memory stays O(M) for any DNA length.
+
+        Parameters:
+            codons: Iterable[int] - codon index of dna[i:i+3] for every DNA position i >= start
+            profile: np.ndarray - score profile of the protein, see _score_profile. Passing only
+                the first columns of the profile fills only those columns of every row.
+            M=None: int - protein length, defaults to the width of profile
+            start=0: int - first DNA row to fill
+            window=(): Iterable[tuple] - (C, D) rows start-5 to start-1 when resuming from a later row
+            previous=INVALID_CODON: int - codon index of dna[start-1:start+2]
+
+        Yields:
+            i: int - DNA row
+            I, D, C, T: np.ndarray - row i of each matrix
+        """
+        width = profile.shape[1]
+        M = width - 1 if M is None else M
+        window = deque(window, maxlen=5)
+
+        # Row i scores the codon dna[i-1:i+2], row 0 has no codon
+        for i, codon in enumerate(codons, start):
+            score = profile[previous]
+            previous = codon
+
+            I = np.zeros(width, dtype=profile.dtype)
+            D = np.zeros(width, dtype=profile.dtype)
+            C = np.zeros(width, dtype=profile.dtype)
+            T = np.zeros(width, dtype=np.uint8)
+
+            # Initialization, mirrors the values the Python engine leaves in rows 0 to 4
+            if i <= M:
+                I[0] = NEG_INF
+                T[0] = Action.DELETE.value if i > 0 else 0
+
+            if i == 0:
+                D[:] = NEG_INF
+                T[1:] = Action.INSERT.value
+
+            elif i == 1:
+                D[:] = -self.gop - self.gep
+                C[0] = D[0] if i <= M else 0
+
+                match = window[-1][0][:-1] + score[1:]
+                C[1:] = np.maximum(np.maximum(0, D[1:]), match)
+                T[1:] = np.where(match > np.maximum(0, D[1:]), Action.MATCH.value,
+                                 np.where(D[1:] > 0, Action.DELETE.value, Action.INSERT.value))
+
+            elif i == 2:
+                D[:] = NEG_INF
+                C[0] = D[0] if i <= M else 0
+
+                frameshift_3 = window[-2][0][:-1] + score[1:] - self.frameshift
+                C[1:] = np.maximum(0, frameshift_3)
+                T[1:] = Action.INSERT.value
+
+            elif i == 3:
+                D[:] = NEG_INF
+                C[0] = D[0] if i <= M else 0
+
+                frameshift_1 = window[-2][0][:-1] + score[1:] - self.frameshift
+                C[1:] = np.maximum(0, frameshift_1)
+                T[1:] = np.where(frameshift_1 > 0, Action.FRAMESHIFT_1.value, Action.INSERT.value)
+
+            if i < 4:
+                self._fill_insert_row(I, C)
+            else:
+                self._fill_row(I, D, C, T, window[-4][0], window[-3][0], window[-2][0], window[-3][1], score)
+
+            window.append((C, D))
+            yield i, I, D, C, T
+
+    def _final_cell(self, D_4, C_4, C_3, C_2):
+        """
+        Score and action of the last cell C[N-1][M], given rows N-4, N-3 and N-2 at column M
+        """
+        return max(list(zip(
+            [
+                D_4 - self.frameshift - self.gep,
+                C_4 - self.gop - self.gep - self.frameshift,
+                C_3 - self.frameshift,
+                C_2,
+            ], [
+                Action.DELETE.value, Action.FRAMESHIFT_3.value, Action.FRAMESHIFT_1.value, Action.MATCH.value
+            ])), key=lambda x: x[0])
+
+    def _check_lengths(self, N, M):
+        if N <= max(M, 4):
+            raise ValueError("DNA sequence must be longer than the protein sequence and at least 5 nucleotides long")
+
+    def align(self, dna_input, protein_input, debug=False, linear_space=False, band=None):
         """
         Pairwise alignment of a DNA and Protein sequence using Zhang's Three Frame Algorithm
 
         Parameters:
             dna_input: str - DNA string
             protein_input: str - protein string
-            debug=False: bool - print debug matrices
+            debug=False: bool - print debug matrices, ignored in linear space and banded mode
+            linear_space=False: bool - recompute the traceback from checkpoints instead of keeping
+                the full matrices, see _CheckpointedTraceback
+            band=None: int - only fill cells within band DNA rows of the diagonal from cell (0, 0) to
+                cell (N-1, M), doubling the band until the traceback stays clear of its edges, see _align_banded
 
         Returns:
             score: int - maximal alignment score
             actions: list[Action] - list of actions that produces the alignment
             alignment: list[tuple[str, str]] - list of tuples containing DNA-Protein pairings
         """
+        if linear_space and band is not None:
+            raise ValueError("linear_space and band cannot be combined")
+
+        if linear_space:
+            return self._profiled(self._align_linear, dna_input, protein_input)
+
+        if band is not None:
+            return self._profiled(self._align_banded, dna_input, protein_input, band)
+
+        if self.engine is ThreeFrameAligner.Engine.NUMPY:
+            return self._profiled(self._align_numpy, dna_input, protein_input, debug)
+
+        return self._profiled(self._align_python, dna_input, protein_input, debug)
+
+    def _profiled(self, run, *args):
+        """
+        Calls run(*args), recording ave_mem_usage and peak_mem_usage while profile_memory is set
+        """
+        if not self.profile_memory:
+            return run(*args)
+
+        with MemorySampler() as sampler:
+            result = run(*args)
+
+        self.ave_mem_usage, self.peak_mem_usage = sampler.ave_mem_usage, sampler.peak_mem_usage
+
+        return result
+
+    def align_score(self, dna_input, protein_input):
+        """
+        Score-only alignment that keeps the last five DNA rows instead of the full matrices.
+        Memory is O(M) regardless of the DNA length, and the DNA may be streamed.
+
+        Parameters:
+            dna_input: str | Iterable[str] | TextIO - DNA string, iterable of DNA chunks, or an open file
+            protein_input: str - protein string
+
+        Returns:
+            score: int - maximal alignment score, same as the score returned by align
+        """
+        return self._profiled(self._align_score, dna_input, protein_input)
+
+    def _align_score(self, dna_input, protein_input):
+        M = len(protein_input)
+        profile = self._score_profile(protein_input)
+        codons = chain.from_iterable(iter_encode_dna(dna_input))
+
+        # Column M of the last four rows is all the final cell needs
+        last = deque(maxlen=4)
+        N = 0
+        for N, I, D, C, T in self._fill_rows(codons, profile):
+            last.append((D[M], C[M]))
+        N += 1
+
+        self._check_lengths(N, M)
+
+        if M == 0:
+            return last[-1][1].item()
+
+        (D_4, C_4), (_, C_3), (_, C_2) = last[0], last[1], last[2]
+        score, _ = self._final_cell(D_4, C_4, C_3, C_2)
+
+        return score.item()
+
+    def _align_numpy(self, dna_input, protein_input, debug=False):
+        """
+        NumPy engine for align, fills the matrices one DNA row at a time and
+        returns the same score, actions and alignment as the Python engine
+        """
+        N, M = len(dna_input), len(protein_input)
+        self._check_lengths(N, M)
+
+        profile = self._score_profile(protein_input)
+        T = _PackedTraceback(N, M+1) if self.packed_traceback else np.empty((N, M+1), dtype=np.uint8)
+
+        # Only the traceback is needed afterwards, I, D and C are kept whole for debug printing only
+        if debug:
+            I = np.empty((N, M+1), dtype=profile.dtype)
+            D = np.empty((N, M+1), dtype=profile.dtype)
+            C = np.empty((N, M+1), dtype=profile.dtype)
+
+        # Matrix filling
+        last = deque(maxlen=4)
+        for i, I_row, D_row, C_row, T_row in self._fill_rows(encode_dna(dna_input), profile):
+            T[i] = T_row
+            last.append((D_row[M], C_row[M]))
+            if debug:
+                I[i], D[i], C[i] = I_row, D_row, C_row
+
+        score = last[-1][1]
+        if M > 0:
+            (D_4, C_4), (_, C_3), (_, C_2) = last[0], last[1], last[2]
+            score, T[N-1, M] = self._final_cell(D_4, C_4, C_3, C_2)
+
+        if debug:
+            C[N-1][M] = score
+            T_rows = [[T[i, j] for j in range(M+1)] for i in range(N)] if self.packed_traceback else T.tolist()
+            self._matrix_printer([I.tolist(), D.tolist(), C.tolist(), T_rows])
+
+        score = score.item()
+        actions, alignment = self._traceback(T, N, M, dna_input, protein_input)
+
+        return score, actions, alignment
+
+    def _align_linear(self, dna_input, protein_input):
+        """
+        Linear-space variant of the NumPy engine, returns the same score, actions and alignment as align
+        """
+        N, M = len(dna_input), len(protein_input)
+        self._check_lengths(N, M)
+
+        # A negative gap opening cost lets _traceback walk past row 0 and wrap around to the last rows
+        if self.gop + self.gep < 0:
+            raise ValueError("Linear-space traceback requires gop + gep >= 0")
+
+        T = _CheckpointedTraceback(self, encode_dna(dna_input), self._score_profile(protein_input), self.LINEAR_SPACE_BLOCK)
+        actions, alignment = self._traceback(T, N, M, dna_input, protein_input)
+
+        return T.score, actions, alignment
+
+    def _band_starts(self, N, M, radius):
+        """
+        First protein column of the band in every DNA row, the band is 2 * radius + 1 columns wide
+        """
+        width = 2 * radius + 1
+        centers = np.arange(N) * M // (N - 1)
+
+        return np.clip(centers - radius, 1, M - width + 1)
+
+    def _fill_band(self, codons, profile, starts, width):
+        """
+        Fills the I, D, C and T matrices of the NumPy engine within a diagonal band, one DNA row at a time.
+        Cells outside the band hold _OUT_OF_BAND so that no path leaves the band.
+
+        Parameters:
+            codons: np.ndarray - codon index of dna[i:i+3] for every DNA position i
+            profile: np.ndarray - score profile of the protein, see _score_profile
+            starts: np.ndarray - first protein column of the band in every DNA row, non-decreasing
+            width: int - protein columns in the band
+
+        Yields:
+            i: int - DNA row
+            I, D, C, T: np.ndarray - columns starts[i]-1 to starts[i]+width-1 of row i of each matrix
+        """
+        M = profile.shape[1] - 1
+        window = deque(maxlen=4)
+
+        def realign(start, row, s):
+            shifted = np.full(width + 1, _OUT_OF_BAND, dtype=row.dtype)
+            shifted[:width + 1 - (s - start)] = row[s - start:]
+            return shifted
+
+        # The first rows have their own initialization, fill them whole and cut the band out
+        for i, I, D, C, T in self._fill_rows(codons[:4], profile):
+            band = slice(starts[i] - 1, starts[i] + width)
+            window.append((starts[i], C[band], D[band]))
+            yield i, I[band], D[band], C[band], T[band]
+
+        for i in range(4, len(codons)):
+            s = starts[i]
+            I = np.full(width + 1, _OUT_OF_BAND, dtype=profile.dtype)
+            D = np.full(width + 1, _OUT_OF_BAND, dtype=profile.dtype)
+            C = np.full(width + 1, _OUT_OF_BAND, dtype=profile.dtype)
+            T = np.zeros(width + 1, dtype=np.uint8)
+
+            # Column 0, same values as _fill_rows
+            if s == 1:
+                I[0] = NEG_INF if i <= M else 0
+                D[0] = C[0] = 0
+                T[0] = Action.DELETE.value if i <= M else 0
+
+            (s_4, C_4, _), (s_3, C_3, D_3), (s_2, C_2, _) = window[0], window[1], window[2]
+            self._fill_row(I, D, C, T, realign(s_4, C_4, s), realign(s_3, C_3, s), realign(s_2, C_2, s),
+                           realign(s_3, D_3, s), profile[codons[i-1], s-1:s+width])
+
+            window.append((s, C, D))
+            yield i, I, D, C, T
+
+    def _align_banded(self, dna_input, protein_input, band):
+        """
+        Banded variant of the NumPy engine, only fills O(N * band) cells.
+
+        Leaving out the cells outside the band can only lower the scores inside it, so the result equals
+        align whenever the optimal alignment lies inside the band. Whenever the traceback reaches an edge
+        of the band the band is doubled and the alignment recomputed, once it covers every column the
+        full matrices are filled. An optimal alignment far from the diagonal can go unnoticed when the
+        best alignment inside the band never reaches its edges, which is rare for near-collinear pairs
+        but common for unrelated sequences.
+        """
+        N, M = len(dna_input), len(protein_input)
+        self._check_lengths(N, M)
+
+        if band < 1:
+            raise ValueError("band must be at least 1")
+
+        codons = encode_dna(dna_input)
+        profile = self._score_profile(protein_input)
+
+        radius = -(-band // 3)
+        while 2 * radius + 1 < M:
+            width = 2 * radius + 1
+            starts = self._band_starts(N, M, radius)
+            T = np.empty((N, width + 1), dtype=np.uint8)
+
+            # Matrix filling
+            last = []
+            for i, I_row, D_row, C_row, T_row in self._fill_band(codons, profile, starts, width):
+                T[i] = T_row
+
+                if i >= N - 4:
+                    col = M - starts[i] + 1
+                    last.append((D_row[col], C_row[col]) if col <= width else (_OUT_OF_BAND, _OUT_OF_BAND))
+
+            (D_4, C_4), (_, C_3), (_, C_2) = last[0], last[1], last[2]
+            score, T[N-1, M - starts[N-1] + 1] = self._final_cell(D_4, C_4, C_3, C_2)
+
+            try:
+                actions, alignment = self._traceback(_BandedTraceback(T, starts, M), N, M, dna_input, protein_input)
+            except _BandEdgeReached:
+                radius *= 2
+                continue
+
+            return score.item(), actions, alignment
+
+        return self._align_numpy(dna_input, protein_input)
+
+    def _align_python(self, dna_input, protein_input, debug=False):
+        """
+        Reference Python engine for align, see align for parameters and return values
+        """
         # Define I, D, C, and Traceback matrices of size m x n
         N, M = len(dna_input), len(protein_input)
         I = [[int() for _ in range(M+1)] for _ in range(N)]
         D = [[int() for _ in range(M+1)] for _ in range(N)]
         C = [[int() for _ in range(M+1)] for _ in range(N)]
-        T = [[int() for _ in range(M+1)] for _ in range(N)]
+        T = np.zeros((N, M+1), dtype=np.uint8)
 
         # Initialization
         for j in range(M+1):
@@ -149,13 +568,8 @@ class ThreeFrameAligner():
                 ])), key=lambda x: x[0])
 
         # Matrix filling
-        ave_mem_usage = 0
-        num_samples = 0
         for i in range(N):
             for j in range(1, M+1):
-                ave_mem_usage = (ave_mem_usage * num_samples + self.process.memory_info().rss) / (num_samples + 1)
-                num_samples += 1
-
                 I[i][j] = max(I[i][j-1] - self.gep, C[i][j-1] - self.gop - self.gep)
 
                 if i < 4:
@@ -186,12 +600,154 @@ class ThreeFrameAligner():
                             Action.DELETE.value, Action.FRAMESHIFT_3.value, Action.FRAMESHIFT_1.value, Action.MATCH.value
                         ])), key=lambda x: x[0])
 
-        self.ave_mem_usage = ave_mem_usage - self.init_mem
-
         if debug:
-            self._matrix_printer([I, D, C, T])
+            self._matrix_printer([I, D, C, T.tolist()])
 
         score = C[N-1][M]
         actions, alignment = self._traceback(T, N, M, dna_input, protein_input)
 
         return score, actions, alignment
+
+
+# Value of cells outside the band of _fill_band, far below any score while leaving room for penalties
+_OUT_OF_BAND = np.iinfo(np.int32).min // 2
+
+
+class _BandEdgeReached(Exception):
+    pass
+
+
+class _BandedTraceback():
+    """
+    Read-only stand-in for the traceback matrix T of the banded alignment, T[i, j] raises
+    _BandEdgeReached when cell (i, j) is on or outside the edge of the band
+    """
+
+    def __init__(self, T, starts, M):
+        self.T = T
+        self.starts = starts
+        self.M = M
+
+    def __getitem__(self, key):
+        i, j = key
+        start = self.starts[i]
+        width = self.T.shape[1] - 1
+
+        # Column start-1 is outside the band unless it is column 0
+        col = j - start + 1
+        if (col <= 1 and start > 1) or (col >= width and start + width - 1 < self.M) or not 0 <= col <= width:
+            raise _BandEdgeReached()
+
+        return self.T[i, col]
+
+
+class _PackedTraceback():
+    """
+    Traceback matrix holding two actions per byte, every action fits in 4 bits.
+    Supports the T[i] = row and T[i, j] accesses of the NumPy engine and _traceback.
+    """
+
+    def __init__(self, N, width):
+        self.width = width
+        self.data = np.zeros((N, (width + 1) // 2), dtype=np.uint8)
+
+    def __setitem__(self, key, value):
+        if isinstance(key, tuple):
+            i, j = key
+            shift = 4 * (j % 2)
+            self.data[i, j // 2] = (self.data[i, j // 2] & (0xF0 >> shift)) | (int(value) << shift)
+            return
+
+        row = np.zeros(2 * self.data.shape[1], dtype=np.uint8)
+        row[:self.width] = value
+        self.data[key] = row[0::2] | (row[1::2] << 4)
+
+    def __getitem__(self, key):
+        i, j = key
+        return (self.data[i, j // 2] >> (4 * (j % 2))) & 0x0F
+
+
+class _CheckpointedTraceback():
+    """
+    Read-only stand-in for the traceback matrix T used by the linear-space alignment.
+
+    Rows are recomputed by the NumPy engine from checkpoints of its five-row state. When a row is
+    requested, the gap between it and the nearest checkpoint above is halved until it fits in one
+    block, so O(log N) checkpoints of O(M) each are alive at any time. The first pass spaces its
+    checkpoints evenly instead, so most blocks are recomputed only once. Only columns up to the
+    requested one are recomputed. _traceback reads T bottom-up with a non-increasing column, which
+    is all this supports.
+    """
+
+    FIRST_PASS_CHECKPOINTS = 16
+
+    def __init__(self, aligner, codons, profile, block_size):
+        self.aligner = aligner
+        self.codons = codons
+        self.profile = profile
+        self.block_size = block_size
+        self.N, self.M = len(codons), profile.shape[1] - 1
+        self.stride = max(block_size, -(-self.N // self.FIRST_PASS_CHECKPOINTS))
+
+        self.checkpoints = [(0, ())]
+        self.block = np.empty((0, 0), dtype=np.uint8)
+        self.block_start = self.N
+
+        self.score = None
+        self.last_row = None
+
+    def __getitem__(self, key):
+        i, j = key
+        # A frameshift out of row 1 makes _traceback look up row -1, i.e. the last row
+        if i == -1:
+            return self.last_row[j]
+
+        if i < 0:
+            raise IndexError("Linear-space traceback only wraps around to the last row")
+
+        if not (self.block_start <= i < self.block_start + len(self.block)) or j >= self.block.shape[1]:
+            self._load(i, j + 1)
+
+        return self.block[i - self.block_start, j]
+
+    def _fill(self, start, stop, width, window):
+        previous = self.codons[start-1] if start > 0 else INVALID_CODON
+        window = [(C[:width], D[:width]) for C, D in window]
+
+        return self.aligner._fill_rows(self.codons[start:stop], self.profile[:, :width], self.M, start, window, previous)
+
+    def _load(self, i, width):
+        while self.checkpoints[-1][0] > i:
+            self.checkpoints.pop()
+        start, window = self.checkpoints[-1]
+
+        # The first pass leaves evenly spaced checkpoints, later passes halve the distance to row i
+        # until the remaining rows fit in one block
+        while i - start >= self.block_size:
+            half = (i + 1 - start) // 2
+            mid = start + (min(self.stride, half) if self.score is None else half)
+            window = deque(window, maxlen=5)
+            for _, I, D, C, T in self._fill(start, mid, width, window):
+                window.append((C, D))
+
+            start, window = mid, tuple(window)
+            self.checkpoints.append((start, window))
+
+        window = deque(window, maxlen=5)
+        self.block = np.empty((i + 1 - start, width), dtype=np.uint8)
+        for row, I, D, C, T in self._fill(start, i + 1, width, window):
+            self.block[row - start] = T
+            window.append((C, D))
+        self.block_start = start
+
+        # The first request is always the last cell, which has its own recurrence
+        if self.score is None:
+            M = self.M
+            if M > 0:
+                (C_2, _), (C_3, _), (C_4, D_4) = window[-2], window[-3], window[-4]
+                score, self.block[-1, M] = self.aligner._final_cell(D_4[M], C_4[M], C_3[M], C_2[M])
+            else:
+                score = window[-1][0][M]
+
+            self.score = score.item()
+            self.last_row = self.block[-1].copy()
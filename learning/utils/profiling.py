@@ -0,0 +1,53 @@
+import threading
+import psutil
+
+
+class MemorySampler():
+    """
+    Samples the resident memory of this process on a background thread while used as a context manager.
+    Usage is relative to the resident memory on entry, in bytes.
+
+    Attributes:
+        ave_mem_usage: float - average of the samples
+        peak_mem_usage: int - largest sample
+        num_samples: int - samples taken, one every interval seconds plus one on exit
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.init_mem = 0
+        self.ave_mem_usage = 0
+        self.peak_mem_usage = 0
+        self.num_samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        mem_usage = self.process.memory_info().rss - self.init_mem
+        self.ave_mem_usage = (self.ave_mem_usage * self.num_samples + mem_usage) / (self.num_samples + 1)
+        self.peak_mem_usage = max(self.peak_mem_usage, mem_usage)
+        self.num_samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self.init_mem = self.process.memory_info().rss
+        self.ave_mem_usage = 0
+        self.peak_mem_usage = 0
+        self.num_samples = 0
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+        # Runs shorter than one interval still get a sample
+        self._sample()
+        return False
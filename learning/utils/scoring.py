@@ -0,0 +1,184 @@
+from functools import partial
+import numpy as np
+from utils.constants import NEG_INF, PROTEINS
+
+NUCLEOTIDES = ['A', 'C', 'G', 'T']
+
+# Codon indices 0 - 63 follow the order of CODONS, padded and invalid codons get their own rows
+CODONS = [a + b + c for a in NUCLEOTIDES for b in NUCLEOTIDES for c in NUCLEOTIDES]
+PAD_CODON = len(CODONS)
+INVALID_CODON = len(CODONS) + 1
+NUM_CODONS = len(CODONS) + 2
+
+# Same order as the one-hot columns of utils.encoder, followed by the ambiguity codes found in BLOSUM
+RESIDUES = PROTEINS + ['_', '-', 'B', 'J', 'O', 'U', 'X', 'Z']
+UNKNOWN_RESIDUE = len(RESIDUES)
+NUM_RESIDUES = len(RESIDUES) + 1
+
+# NOTE: Same convention as Environment.get_codon_by_index, any codon touching the '0' padding is padding
+_PAD_NUCLEOTIDE = len(NUCLEOTIDES)
+_INVALID_NUCLEOTIDE = len(NUCLEOTIDES) + 1
+
+_NUCLEOTIDE_CODES = np.full(256, _INVALID_NUCLEOTIDE, dtype=np.uint8)
+_NUCLEOTIDE_CODES[[ord(n) for n in NUCLEOTIDES]] = np.arange(len(NUCLEOTIDES))
+_NUCLEOTIDE_CODES[ord('0')] = _PAD_NUCLEOTIDE
+
+_RESIDUE_CODES = np.full(256, UNKNOWN_RESIDUE, dtype=np.uint8)
+_RESIDUE_CODES[[ord(r) for r in RESIDUES]] = np.arange(len(RESIDUES))
+
+_CODON_INDEX = {codon: i for i, codon in enumerate(CODONS)}
+_RESIDUE_INDEX = {residue: i for i, residue in enumerate(RESIDUES)}
+
+
+def _to_bytes(sequence: str):
+    return np.frombuffer(sequence.encode('ascii', errors='replace'), dtype=np.uint8)
+
+
+def encode_dna(dna: str):
+    """
+    Encodes every codon of a DNA sequence
+
+    Args:
+        dna (str): DNA sequence, may contain '0' padding
+
+    Returns:
+        np.ndarray: uint8 array where entry i is the codon index of dna[i:i+3]
+    """
+    nucleotides = np.append(_NUCLEOTIDE_CODES[_to_bytes(dna)], [_INVALID_NUCLEOTIDE, _INVALID_NUCLEOTIDE])
+    first, second, third = nucleotides[:-2], nucleotides[1:-1], nucleotides[2:]
+
+    padded = (first == _PAD_NUCLEOTIDE) | (second == _PAD_NUCLEOTIDE) | (third == _PAD_NUCLEOTIDE)
+    valid = (first < _PAD_NUCLEOTIDE) & (second < _PAD_NUCLEOTIDE) & (third < _PAD_NUCLEOTIDE)
+    codons = (first.astype(np.intp) * 16) + (second * 4) + third
+
+    return np.where(padded, PAD_CODON, np.where(valid, codons, INVALID_CODON)).astype(np.uint8)
+
+
+def iter_encode_dna(dna, chunk_size: int = 1 << 16):
+    """
+    Encodes the codons of a DNA sequence that is read incrementally
+
+    Args:
+        dna: DNA string, iterable of DNA chunks, or a text stream with a read method.
+             Whitespace in chunks and streams is skipped, e.g. line breaks of a sequence file.
+        chunk_size (int, optional): Characters read per call when dna is a stream. Defaults to 65536.
+
+    Yields:
+        np.ndarray: uint8 codon indices in sequence order, same values as encode_dna on the whole sequence
+    """
+    if isinstance(dna, str):
+        yield encode_dna(dna)
+        return
+
+    if hasattr(dna, 'read'):
+        dna = iter(partial(dna.read, chunk_size), '')
+
+    # The last two nucleotides of a chunk only complete their codons in the next chunk
+    carry = ''
+    for chunk in dna:
+        carry += ''.join(chunk.split())
+        if len(carry) > 2:
+            yield encode_dna(carry)[:-2]
+            carry = carry[-2:]
+
+    if carry:
+        yield encode_dna(carry)
+
+
+def encode_protein(protein: str):
+    """
+    Encodes every residue of a protein sequence
+
+    Args:
+        protein (str): Protein sequence
+
+    Returns:
+        np.ndarray: uint8 array of residue indices
+    """
+    return _RESIDUE_CODES[_to_bytes(protein)]
+
+
+def codon_index(codon: str):
+    if '0' in codon:
+        return PAD_CODON
+
+    return _CODON_INDEX.get(codon, INVALID_CODON)
+
+
+def residue_index(residue: str):
+    return _RESIDUE_INDEX.get(residue, UNKNOWN_RESIDUE)
+
+
+def build_score_table(substitution, code: dict, default: int = NEG_INF):
+    """
+    Builds a dense codon by residue score table
+
+    Args:
+        substitution: Substitution matrix indexed as substitution[residue][residue], e.g. blosum.BLOSUM
+        code (dict): Genetic code mapping codons to residues, '000' is used for padded codons
+        default (int, optional): Score of pairs that cannot be translated or scored. Defaults to NEG_INF.
+
+    Returns:
+        np.ndarray: int16 array of shape (NUM_CODONS, NUM_RESIDUES)
+    """
+    table = np.full((NUM_CODONS, NUM_RESIDUES), default, dtype=np.int16)
+
+    for i, codon in enumerate(CODONS + ['000']):
+        if codon not in code:
+            continue
+
+        for j, residue in enumerate(RESIDUES):
+            try:
+                score = substitution[code[codon]][residue]
+            except KeyError:
+                continue
+
+            if not np.isfinite(score):
+                continue
+
+            if score != int(score):
+                raise ValueError(f"Score table only holds integer scores, got {score} for {code[codon]}/{residue}")
+
+            table[i, j] = score
+
+    return table
+
+
+def build_codon_encoding(encoded_codons: dict, default):
+    """
+    Builds a dense codon one-hot table from the codon encoding of utils.encoder
+
+    Args:
+        encoded_codons (dict): One-hot vector of every codon, '000' is used for padded codons
+        default: One-hot vector of codons missing from encoded_codons
+
+    Returns:
+        np.ndarray: float32 array of shape (NUM_CODONS, len(default))
+    """
+    table = np.tile(np.asarray(default, dtype=np.float32), (NUM_CODONS, 1))
+
+    for i, codon in enumerate(CODONS + ['000']):
+        if codon in encoded_codons:
+            table[i] = encoded_codons[codon]
+
+    return table
+
+
+def build_residue_encoding(encoded_proteins: dict, default):
+    """
+    Builds a dense residue one-hot table from the protein encoding of utils.encoder
+
+    Args:
+        encoded_proteins (dict): One-hot vector of every residue
+        default: One-hot vector of residues missing from encoded_proteins
+
+    Returns:
+        np.ndarray: float32 array of shape (NUM_RESIDUES, len(default))
+    """
+    table = np.tile(np.asarray(default, dtype=np.float32), (NUM_RESIDUES, 1))
+
+    for i, residue in enumerate(RESIDUES):
+        if residue in encoded_proteins:
+            table[i] = encoded_proteins[residue]
+
+    return table